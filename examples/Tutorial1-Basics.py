@@ -249,6 +249,64 @@ print(f'Output voltage range: [{vMin:6f}, {vMax:6f}] V')
 print(f'Output current range: [{iMin:6f}, {iMax:6f}] A')
 
 
+# #### Bonus: A faster start of a test station
+# `get_first_board()` detects and initializes all devices one after the other.
+# The 2-step procedure of detecting and initializing can be used to speed up the start of a test program:
+# after `detect_devices()`, the initialization of the devices is queued with one call per board (`wait_for_result=False`),
+# so that the boards are initialized in parallel. The function then polls until all devices are initialized (or the timeout has expired)
+# and raises an error if the initialization of a device failed. Devices that are already initialized are skipped.  
+# The function is used instead of `get_first_board()` at the start of a program.
+# *(Note: the initialization resets all channels, so the setup of the channels has to be done afterwards in any case)*
+
+# In[ ]:
+
+
+import time
+
+def warm_start(srunner : IdSmuServiceRunner, timeout=30.0):
+    """Detects the devices, initializes the devices of all boards in parallel and returns the boards"""
+    service : IdSmuService = srunner.get_idsmu_service()
+    if not service.devices_are_detected():
+        reply = service.detect_devices()
+        if reply.is_error():
+            raise RuntimeError(reply.to_json())
+    boards = {board_address: service.get_board(board_address) for board_address in service.get_board_addresses()}
+    pending = {}
+    for board_address, board in boards.items():
+        device_ids = [device.hardware_id for device in board.get_slots() if not board.is_device_initialized(device.hardware_id)]
+        if device_ids:
+            board.initialize_devices(False, device_ids)
+            pending[board_address] = device_ids
+    end_time = time.monotonic() + timeout
+    while True:
+        pending = {board_address: [device_id for device_id in device_ids if not boards[board_address].is_device_initialized(device_id)]
+                   for board_address, device_ids in pending.items()}
+        pending = {board_address: device_ids for board_address, device_ids in pending.items() if device_ids}
+        if not pending or time.monotonic() > end_time:
+            break
+        time.sleep(0.01)
+    for board_address in pending:
+        errors = [reply.to_json() for reply in boards[board_address].get_initialize_devices_results() if reply.is_error()]
+        if errors:
+            raise RuntimeError('\n'.join(errors))
+    if pending:
+        raise RuntimeError(f'The devices {pending} have not been initialized within {timeout} s')
+    return boards
+
+
+# In this tutorial, the devices have already been initialized by `get_first_board()`.
+# To show the start of a program, the service is shut down and a new service is started, whose devices are detected and initialized by `warm_start()`:
+
+# In[ ]:
+
+
+srunner.shutdown()
+srunner = IdSmuServiceRunner()
+start = time.perf_counter()
+boards = warm_start(srunner)
+print(f'{list(boards)} initialized in {time.perf_counter() - start:.2f} s')
+
+
 # In[18]:
 
 
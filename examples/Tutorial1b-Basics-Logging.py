@@ -90,6 +90,217 @@ mbX1.set_enable_clamps(True, ["M1.S1.C1"])
 # FtdiDevice: Word# written 00001: 0x00000001  
 # FtdiDevice: Word# written 00002: 0x0000001b
 
+# ## Tracing board commands
+# The Trace log level is too slow to be switched on permanently. However, many problems only occur in production.
+# To see afterwards which commands were executed before a problem occurred, the calls of the board methods can be recorded in a ring buffer.
+# Each call is stored as a row of a preallocated numpy array (sequence number, method, start time, duration and error flag), so recording costs very little time.
+# When the buffer is full, the oldest entries are overwritten.  
+# The `TracedBoard` class below is used instead of the board and records all method calls. `dump_trace()` writes the recorded calls to a binary file
+# (the suffix `.npz` is added if it is missing), which can be decoded later (e.g. after a crash or on another computer) into text lines similar to the log.  
+# Note that this records the Python calls of the board methods, not the words of the communication protocol, which are only shown by the Trace log level of the engine.
+# The ring buffer is also not connected to the `LogService`: the engine offers no way to add it there, so the test program itself has to call `dump_trace()`, e.g. in an exception handler:
+
+# In[ ]:
+
+
+import itertools, logging, time
+import numpy as np
+
+TRACE_RECORD = np.dtype([('sequence', '<u8'), ('method', '<u2'), ('start', '<i8'), ('duration', '<i8'), ('error', '?')])
+
+def trace_file_path(file_path):
+    # np.savez() appends .npz to file names without this suffix
+    file_path = str(file_path)
+    return file_path if file_path.endswith('.npz') else file_path + '.npz'
+
+class TraceRing:
+    """Ring buffer of method calls with preallocated binary records"""
+    def __init__(self, size=65536):
+        self.records = np.zeros(size, dtype=TRACE_RECORD)
+        self.sequence = itertools.count()
+        self.methods = []
+        # offset between perf_counter_ns() and the time since the epoch
+        self.time_offset = time.time_ns() - time.perf_counter_ns()
+
+    def method_id(self, name):
+        if name not in self.methods:
+            self.methods.append(name)
+        return self.methods.index(name)
+
+    def record(self, method_id, start, duration, error):
+        sequence = next(self.sequence)
+        self.records[sequence % len(self.records)] = (sequence, method_id, start, duration, error)
+        return sequence
+
+    def dump_trace(self, file_path):
+        """Writes the recorded calls in the order of the calls to a binary file and returns its path"""
+        file_path = trace_file_path(file_path)
+        records = self.records[self.records['duration'] > 0]
+        np.savez(file_path, records=np.sort(records, order='sequence'), methods=np.array(self.methods), time_offset=self.time_offset)
+        return file_path
+
+class TracedBoard:
+    """Proxy of a board that records all method calls in a TraceRing (and optionally logs them)"""
+    def __init__(self, board, trace : TraceRing, logger=None):
+        self._board = board
+        self._trace = trace
+        self._logger = logger
+
+    def __getattr__(self, name):
+        attribute = getattr(self._board, name)
+        if not callable(attribute):
+            return attribute
+        method_id = self._trace.method_id(name)
+        def traced(*args, **kwargs):
+            start = time.perf_counter_ns()
+            error = True
+            try:
+                result = attribute(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                duration = max(time.perf_counter_ns() - start, 1)
+                sequence = self._trace.record(method_id, start, duration, error)
+                if self._logger is not None:
+                    # the channel names or the device id are the last parameter of most board methods
+                    device = args[-1] if args and isinstance(args[-1], (str, list)) else None
+                    self._logger.log(logging.ERROR if error else logging.INFO, name,
+                                     extra={'command': sequence, 'device': device, 'duration': duration / 1000})
+        # the wrapper is created once per method
+        setattr(self, name, traced)
+        return traced
+
+def decode_trace(file_path):
+    """Returns the calls of a trace file as text lines"""
+    with np.load(trace_file_path(file_path)) as trace:
+        records, methods, time_offset = trace['records'], trace['methods'], int(trace['time_offset'])
+    lines = []
+    for record in records:
+        start = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime((int(record['start']) + time_offset) / 1e9))
+        lines.append(f"{start} TraceRing: Call# {record['sequence']:05d}: {methods[record['method']]}, "
+                     f"duration = {record['duration'] / 1000:.1f} us{', failed' if record['error'] else ''}")
+    return lines
+
+
+# The board is used via the proxy. Properties like `idSmu2Modules` are passed through, but only the calls of board methods are recorded:
+
+# In[ ]:
+
+
+trace = TraceRing(size=1024)
+traced_mbX1 = TracedBoard(mbX1, trace)
+traced_mbX1.set_voltages(1.0, ["M1.S1.C1"])
+traced_mbX1.set_enable_channels(True, ["M1.S1.C1"])
+traced_mbX1.measure_channels(True, 1, 1, ["M1.S1.C1"])
+
+trace.dump_trace("trace.npz")
+for line in decode_trace("trace.npz"):
+    print(line)
+
+
+# ## Asynchronous logging of the test program
+# Writing log entries to a file in the thread that executes the test program delays the program, especially when the file system is slow.
+# With the `logging` module of Python, the entries can instead be put into a queue and written to the file by a background thread.
+# The queue is limited in size, so that the memory does not grow if the file cannot be written fast enough.
+# If the queue is full, the entries are either dropped (and counted in `dropped`) or the program waits until there is space again (`overflow='block'`).
+# The file is written as JSON lines (one JSON object per line), which can be read e.g. with `pandas.read_json(file, lines=True)`.
+# The traceback of an exception (e.g. logged with `logger.exception()`) is formatted before the entry is put into the queue and written to the field `exception`.
+# When the file reaches `max_bytes`, it is renamed and a new file is started; `backup_count` old files are kept.  
+# A `TracedBoard` (see above) with a logger logs each board method call with the fields `command` (sequence number), `device` (channels or device) and `duration` (in µs):
+
+# In[ ]:
+
+
+import copy, json, logging.handlers, queue, threading
+
+class JsonLinesFormatter(logging.Formatter):
+    FIELDS = ('command', 'device', 'duration', 'exception')
+
+    def format(self, record):
+        entry = {'time': record.created, 'level': record.levelname, 'logger': record.name, 'message': record.getMessage()}
+        for field in self.FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler with a limited queue that drops (and counts) entries or waits if the queue is full"""
+    exception_formatter = logging.Formatter()
+
+    def __init__(self, max_size, overflow='drop'):
+        super().__init__(queue.Queue(max_size))
+        self.block = overflow == 'block'
+        self.dropped = 0
+        # entries can be logged from several threads at the same time
+        self.dropped_lock = threading.Lock()
+
+    def enqueue(self, record):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+
+    def prepare(self, record):
+        # QueueHandler.prepare() would append the traceback to the message and remove exc_info,
+        # so the traceback is formatted here and kept in a field of its own
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exception = self.exception_formatter.formatException(record.exc_info)
+        record.exc_info = record.exc_text = record.stack_info = None
+        return record
+
+class BlockingQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # waits for space in a full queue, so that all entries are written before the listener stops
+        self.queue.put(self._sentinel)
+
+def start_file_log(file_path, logger_name='test', max_size=10000, overflow='drop', max_bytes=10_000_000, backup_count=5):
+    """Connects the logger to a JSON lines file via a queue, returns the handler and the listener"""
+    file_handler = logging.handlers.RotatingFileHandler(file_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(JsonLinesFormatter())
+    queue_handler = BoundedQueueHandler(max_size, overflow)
+    listener = BlockingQueueListener(queue_handler.queue, file_handler)
+    listener.start()
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(queue_handler)
+    return queue_handler, listener
+
+def stop_file_log(queue_handler, listener, logger_name='test'):
+    logging.getLogger(logger_name).removeHandler(queue_handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+# In[ ]:
+
+
+queue_handler, listener = start_file_log("log.jsonl")
+logged_mbX1 = TracedBoard(mbX1, trace, logging.getLogger('test'))
+logged_mbX1.set_voltages(2.0, ["M1.S1.C1"])
+logged_mbX1.measure_channels(True, 1, 1, ["M1.S1.C1"])
+logging.getLogger('test').info('DUT 1 done')
+try:
+    raise RuntimeError('contact check failed')
+except RuntimeError:
+    logging.getLogger('test').exception('DUT 2 failed')
+stop_file_log(queue_handler, listener)
+print(f'{queue_handler.dropped} entries dropped')
+
+with open("log.jsonl") as file:
+    for line in file:
+        print(json.loads(line))
+
+
 # In[9]:
 
 
@@ -244,6 +244,447 @@ fig
 #fig.show()
 
 
+# ### Collecting settings and writing them at once
+# By default, the immediate mode of a board is enabled and every method call that changes a parameter is written to the hardware immediately.
+# With `set_immediate_mode(False)`, the changes are only made in the board model and are written together by `write_uncommited_settings()`, with one command per device.
+# As the immediate mode is a state of the board, it must be reset reliably, even if an error occurs.
+# A context manager takes care of this: all settings made in the `with` block are written when the block is left.
+# With `wait_for_result=False`, the write command is only queued and the result can be queried later via the `result` attribute.
+# Nested blocks are written by the outermost block.
+# If an error occurs in the block, the settings made before the error are written as well, as there is no way to discard them:
+# otherwise they would stay in the board model and be written unexpectedly with a later write. The immediate mode is restored after the write:
+
+# In[ ]:
+
+
+class Batch:
+    """Context manager that writes all settings made in the block with one command per device"""
+    def __init__(self, board, wait_for_result=True):
+        self.board = board
+        self.wait_for_result = wait_for_result
+        self.result = None
+
+    def __enter__(self):
+        self.immediate_mode = self.board.get_immediate_mode()
+        self.board.set_immediate_mode(False)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if self.immediate_mode:
+                self.result = self.board.write_uncommited_settings(self.wait_for_result)
+        finally:
+            self.board.set_immediate_mode(self.immediate_mode)
+        return False
+
+with Batch(mbX1):
+    mbX1.set_voltages(1.0, ["channel1"])
+    mbX1.set_voltages(2.0, ["channel2"])
+    smuchannel1.clamp_high_value = 0.01
+    mbX1.print_uncommited_registers()
+print(smuchannel1.voltage, smuchannel2.voltage)
+
+# the write command is only queued
+with Batch(mbX1, wait_for_result=False) as batch:
+    mbX1.set_voltages(3.0, ["channel1", "channel2"])
+print(mbX1.get_immediate_mode())
+
+
+# ### Different values for many channels
+# The board methods set the same value for all listed channels.
+# If each channel needs its own value, e.g. 160 different voltages on an MbX-16 board, a call per channel would send a command per channel.
+# Inside a `Batch` block, the calls only change the board model and all changes are written with one command per device.
+# The helper function below groups the channels by their value, so that channels with equal values are still set in a single call.
+# Methods with more than one value, like `set_clamps_low_and_high_values()`, take a tuple of values per channel:
+
+# In[ ]:
+
+
+from aspectdeviceengine.enginecore import CurrentRange
+
+def set_per_channel(board, board_method, values, channel_names):
+    """Calls a board method (e.g. IdSmuBoardModel.set_voltages) with one value or tuple of values per channel"""
+    groups = {}
+    for channel_name, value in zip(channel_names, values):
+        key = tuple(value) if isinstance(value, (tuple, list, np.ndarray)) else (value,)
+        groups.setdefault(key, []).append(channel_name)
+    with Batch(board) as batch:
+        for key, names in groups.items():
+            board_method(board, *key, names)
+    return batch.result
+
+set_per_channel(mbX1, IdSmuBoardModel.set_voltages, [1.5, 2.5], ["channel1", "channel2"])
+set_per_channel(mbX1, IdSmuBoardModel.set_clamps_low_and_high_values, [(-1e-3, 1e-3), (-2e-3, 2e-3)], ["channel1", "channel2"])
+set_per_channel(mbX1, IdSmuBoardModel.set_current_ranges,
+                [CurrentRange.Range_2mA_SMU, CurrentRange.Range_200uA_SMU], ["channel1", "channel2"])
+
+# a ramp of voltages over all channels of the board
+all_channel_ids = [channel_id for device in mbX1.get_slots() for channel_id in device.channel_ids]
+set_per_channel(mbX1, IdSmuBoardModel.set_voltages, np.linspace(0, 1.6, len(all_channel_ids)), all_channel_ids)
+print(smuchannel1.voltage, smuchannel2.voltage)
+
+
+# ### Resolving channel lists once
+# The board methods resolve the given names or ids for every call, and as noted above, the list must not contain duplicates.
+# If the same channels are used over and over again, the list can be prepared once:
+# the names are resolved to the hardware ids, duplicates are removed and the ids are sorted by device and channel number.
+# The `ChannelGroup` class below is a list of these ids and can therefore be passed to all board methods.
+# As the hardware ids of the channels never change, a group stays valid when channels are renamed.
+# The `by_device` attribute contains the channel ids for each device:
+
+# In[ ]:
+
+
+class ChannelGroup(list):
+    """Sorted list of unique channel ids, resolved once from channel names or ids"""
+    def __init__(self, board, channel_names):
+        resolved = {}
+        for device in board.get_slots():
+            for channel_id in device.channel_ids:
+                resolved[channel_id] = resolved[board.get_channel_name(channel_id)] = (device.hardware_id, channel_id)
+        unknown = [channel_name for channel_name in channel_names if channel_name not in resolved]
+        if unknown:
+            raise KeyError(f'Unknown channels: {unknown}')
+        # sort by the numbers in the id (Mx.Sy.Cz), so that C10 follows C9
+        channels = sorted(set(resolved[channel_name] for channel_name in channel_names),
+                          key=lambda channel: [int(part[1:]) for part in channel[1].split('.')])
+        super().__init__(channel_id for _, channel_id in channels)
+        self.by_device = {}
+        for device_id, channel_id in channels:
+            self.by_device.setdefault(device_id, []).append(channel_id)
+
+led_channels = ChannelGroup(mbX1, ["channel2", "channel1", "M1.S1.C1"])
+print(led_channels, led_channels.by_device)
+
+mbX1.set_voltages(1.5, led_channels)
+measresults = mbX1.measure_channels(wait_for_result=True, sample_count=1, repetitions=2, channel_names=led_channels)
+
+# the group is still valid after renaming a channel
+mbX1.set_channel_name("M1.S1.C1", "led1")
+mbX1.set_voltages(2.5, led_channels)
+mbX1.set_channel_name("M1.S1.C1", "channel1")
+
+
+# ### Reading the state of all channels at once
+# Reading the state of many channels via the channel properties means a lot of single calls.
+# The settings service (see the chapters about parameter tables) exports the state of a complete board into a table in one call.
+# The helper function below converts the channel groups of this table into numpy arrays, one array for each column.
+# The data types are taken from the type descriptors of the table: numbers and flags become numeric arrays, everything else (e.g. enumeration values) string arrays.
+# Optionally, the result is reduced to a list of channel names or ids.
+# The rows of the table groups are read with `get_rows()` in one call per group.
+# *(Note: the exported table is stored in the settings service under the board address and replaces a table with the same name.
+# The function removes it again afterwards, unless a table with this name existed before)*
+
+# In[ ]:
+
+
+def column_array(values, type_descriptor):
+    if type_descriptor == ['float']:
+        return np.array([float(value.replace(',', '.')) if value else np.nan for value in values])
+    if type_descriptor == ['int']:
+        return np.array([int(value) if value else 0 for value in values])
+    if type_descriptor == ['bool']:
+        return np.array([value == '1' for value in values])
+    return np.array(values, dtype=str)
+
+def get_channel_states(settings_service, board, channel_names=None):
+    """Returns a dictionary with a numpy array for each column of the channel tables of the board"""
+    table_existed = board.get_address() in settings_service.get_parameter_settings_names()
+    table = settings_service.get_parameter_settings_for_board(board.get_address())
+    try:
+        columns = {}
+        groups = [group for group in table.table_groups if group.name.endswith('-Channel')]
+        if not groups:
+            return columns
+        group_rows = [group.get_rows() for group in groups]
+        descriptors = groups[0].get_range_descriptors()
+        common_columns = [column for column in groups[0].columns if all(column in group.columns for group in groups)]
+        for column in common_columns:
+            values = []
+            for group, rows in zip(groups, group_rows):
+                index = list(group.columns).index(column)
+                values += [row[index].cell_value or '' for row in rows]
+            columns[column] = column_array(values, descriptors.get(column, []))
+    finally:
+        if not table_existed:
+            settings_service.remove_parameter_setting(table.name)
+    if channel_names is not None:
+        selected = np.isin(columns['HardwareId'], channel_names) | np.isin(columns['Name'], channel_names)
+        columns = {column: values[selected] for column, values in columns.items()}
+    return columns
+
+settings_service = srunner.get_idsmu_service().get_settings_service()
+channel_states = get_channel_states(settings_service, mbX1)
+print(list(channel_states))
+enabled_channels = channel_states['HardwareId'][channel_states['EnableOutput']]
+print(f'Enabled channels: {enabled_channels}')
+print(get_channel_states(settings_service, mbX1, ["channel1", "channel2"])['OutputForceValue'])
+
+
+# ### Where does the time go?
+# To optimise a test program, it is necessary to know how much time is spent in which board methods.
+# The `MeteredBoard` class below is used instead of the board and measures the duration of every method call.
+# The durations are collected per method in histograms with buckets of powers of two microseconds (1, 2, 4, 8 ... µs), from which percentiles can be estimated.
+# In addition, the calls are counted per device (the devices are taken from the results, e.g. of measurements, or from a device id as last parameter).
+# For results with an `execution_time` (e.g. measurements), the execution time on the device is collected as well,
+# the difference to the call duration is the time spent in the queue, in the data transfer and in Python.
+# The number of calls running at the same time (e.g. from several threads) and its maximum are also recorded.  
+# The proxy is derived from `CallHookBoard`, which calls `_call_started()` and `_call_finished()` around every method call of the board
+# (the trace in the next section uses it as well).
+# The metrics can be read as dictionary with `to_dict()` or written as a text file in the Prometheus format with `write_prometheus()`,
+# which can be collected e.g. by the textfile collector of the Prometheus node exporter:
+
+# In[ ]:
+
+
+import threading, os, time
+
+class LatencyHistogram:
+    """Histogram of durations in buckets of powers of two microseconds"""
+    BUCKETS = 32
+
+    def __init__(self):
+        self.counts = np.zeros(self.BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, microseconds):
+        # bucket i contains the durations < 2**i µs
+        self.counts[min(int(microseconds).bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.sum += microseconds
+
+    def percentile(self, percent):
+        """Returns the upper bound of the bucket that contains the percentile"""
+        return 2 ** int(np.searchsorted(np.cumsum(self.counts), percent / 100 * self.count))
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99),
+                'buckets': {2 ** bucket: int(count) for bucket, count in enumerate(self.counts) if count}}
+
+class CommandMetrics:
+    """Call durations, device execution times and counters per board method"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.execution_times = {}
+        self.device_calls = {}
+        self.errors = {}
+        self.running = 0
+        self.max_running = 0
+
+    def call_started(self):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+    def call_finished(self, method, devices, microseconds, execution_times, error):
+        with self.lock:
+            self.running -= 1
+            self.durations.setdefault(method, LatencyHistogram()).add(microseconds)
+            for device in devices:
+                self.device_calls[(method, device)] = self.device_calls.get((method, device), 0) + 1
+            for device, execution_time in execution_times:
+                self.execution_times.setdefault((method, device), LatencyHistogram()).add(execution_time)
+            if error:
+                self.errors[method] = self.errors.get(method, 0) + 1
+
+    def to_dict(self):
+        with self.lock:
+            return {'methods': {method: dict(histogram.to_dict(), errors=self.errors.get(method, 0))
+                                for method, histogram in self.durations.items()},
+                    'device_calls': {f'{method} {device}': count for (method, device), count in self.device_calls.items()},
+                    'execution_times': {f'{method} {device}': histogram.to_dict()
+                                        for (method, device), histogram in self.execution_times.items()},
+                    'running': self.running, 'max_running': self.max_running}
+
+    def write_prometheus(self, file_path, prefix='idsmu'):
+        lines = []
+        def histogram_lines(name, labels, histogram):
+            cumulative = np.cumsum(histogram.counts)
+            for bucket in range(LatencyHistogram.BUCKETS):
+                lines.append(f'{name}_bucket{{{labels},le="{2 ** bucket}"}} {cumulative[bucket]}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        with self.lock:
+            lines += [f'# HELP {prefix}_call_duration_microseconds Duration of the board method calls',
+                      f'# TYPE {prefix}_call_duration_microseconds histogram']
+            for method, histogram in self.durations.items():
+                histogram_lines(f'{prefix}_call_duration_microseconds', f'method="{method}"', histogram)
+            lines += [f'# HELP {prefix}_execution_time_microseconds Execution time on the device reported in the results',
+                      f'# TYPE {prefix}_execution_time_microseconds histogram']
+            for (method, device), histogram in self.execution_times.items():
+                histogram_lines(f'{prefix}_execution_time_microseconds', f'method="{method}",device="{device}"', histogram)
+            lines += [f'# HELP {prefix}_calls_total Number of calls per method and device', f'# TYPE {prefix}_calls_total counter']
+            lines += [f'{prefix}_calls_total{{method="{method}",device="{device}"}} {count}'
+                      for (method, device), count in self.device_calls.items()]
+            lines += [f'# HELP {prefix}_errors_total Number of failed calls', f'# TYPE {prefix}_errors_total counter']
+            lines += [f'{prefix}_errors_total{{method="{method}"}} {count}' for method, count in self.errors.items()]
+            lines += [f'# HELP {prefix}_running_calls Number of calls running at the same time', f'# TYPE {prefix}_running_calls gauge',
+                      f'{prefix}_running_calls {self.running}', f'# TYPE {prefix}_max_running_calls gauge',
+                      f'{prefix}_max_running_calls {self.max_running}']
+        # written under a temporary name, so that the collector never reads an incomplete file
+        with open(file_path + '.tmp', 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(file_path + '.tmp', file_path)
+
+class CallHookBoard:
+    """Proxy of a board that calls _call_started() and _call_finished() around all method calls"""
+    def __init__(self, board):
+        self._board = board
+
+    def _call_started(self, name):
+        pass
+
+    def _call_finished(self, name, args, result, start, end, error):
+        """start and end are time.perf_counter() values, result is None if the call raised an error"""
+        pass
+
+    @staticmethod
+    def _replies(result):
+        return result if isinstance(result, list) else [result]
+
+    def __getattr__(self, name):
+        attribute = getattr(self._board, name)
+        if not callable(attribute):
+            return attribute
+        def hooked(*args, **kwargs):
+            self._call_started(name)
+            start = time.perf_counter()
+            result, error = None, True
+            try:
+                result = attribute(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                self._call_finished(name, args, result, start, time.perf_counter(), error)
+        setattr(self, name, hooked)
+        return hooked
+
+class MeteredBoard(CallHookBoard):
+    """Proxy of a board that measures all method calls"""
+    def __init__(self, board, metrics : CommandMetrics):
+        super().__init__(board)
+        self._metrics = metrics
+
+    def _call_started(self, name):
+        self._metrics.call_started()
+
+    def _call_finished(self, name, args, result, start, end, error):
+        execution_times = [(reply.device_id, reply.execution_time) for reply in self._replies(result) if hasattr(reply, 'execution_time')]
+        devices = [device for device, _ in execution_times]
+        if not devices:
+            devices = [str(args[-1]) if args and isinstance(args[-1], str) else 'board']
+        self._metrics.call_finished(name, devices, (end - start) * 1e6, execution_times, error)
+
+
+# A few settings and measurements are made via the proxy and the metrics are printed and exported:
+
+# In[ ]:
+
+
+import json
+metrics = CommandMetrics()
+metered_mbX1 = MeteredBoard(mbX1, metrics)
+for voltage in np.linspace(0, 2, 20):
+    metered_mbX1.set_voltages(voltage, ["channel1", "channel2"])
+    metered_mbX1.measure_channels(wait_for_result=True, sample_count=4, repetitions=1, channel_names=["channel1", "channel2"])
+print(json.dumps(metrics.to_dict(), indent=1))
+metrics.write_prometheus("idsmu_metrics.prom")
+
+
+# ### Showing the timing of the calls
+# To see how the calls from several threads and the execution on the devices overlap in time, the calls can be recorded as a trace.
+# The `trace()` context manager below records all calls of the board made via the returned proxy (a `CallHookBoard` like the `MeteredBoard`) within the `with` block
+# and writes them at the end of the block to a file in the Chrome trace format, which can be opened with [Perfetto](https://ui.perfetto.dev) or `chrome://tracing`.
+# Each call is shown as a bar in the row of the Python thread that made the call.
+# For results with an `execution_time` (e.g. measurements), the execution on the device is shown in a row of the device, ending with the end of the call.
+# This bar is estimated, not measured: the devices only report the execution time, so the bar is placed at the end of the call and marked with `estimated` in its arguments.
+# Calls that only queue a command (`wait_for_result=False`) appear as short bars.
+# Only the calls made via the proxy are recorded. The engine reports no events for queuing or dispatching the commands, so these steps are not shown:
+
+# In[ ]:
+
+
+from contextlib import contextmanager
+
+class ChromeTrace:
+    """Collects events in the Chrome trace format"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.tracks = {}
+        self.start = time.perf_counter()
+
+    def track(self, group, name):
+        """Returns the process and thread id of a named row (e.g. a thread or a device) in a named group (e.g. a board)"""
+        with self.lock:
+            if group not in self.tracks:
+                self.tracks[group] = {}
+                self.events.append({'name': 'process_name', 'ph': 'M', 'pid': len(self.tracks), 'args': {'name': group}})
+            pid = list(self.tracks).index(group) + 1
+            if name not in self.tracks[group]:
+                self.tracks[group][name] = len(self.tracks[group]) + 1
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': self.tracks[group][name], 'args': {'name': name}})
+            return pid, self.tracks[group][name]
+
+    def add(self, name, track, start, duration, args=None):
+        """Adds a complete event, start and duration in seconds"""
+        event = {'name': name, 'ph': 'X', 'pid': track[0], 'tid': track[1], 'ts': (start - self.start) * 1e6, 'dur': duration * 1e6}
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+
+    def save(self, file_path):
+        with open(file_path, 'w') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+
+class TracingBoard(CallHookBoard):
+    """Proxy of a board that records all method calls in a ChromeTrace"""
+    def __init__(self, board, chrome_trace : ChromeTrace):
+        super().__init__(board)
+        self._trace = chrome_trace
+        self._address = board.get_address()
+
+    def _call_finished(self, name, args, result, start, end, error):
+        thread_track = self._trace.track(self._address, threading.current_thread().name)
+        self._trace.add(name, thread_track, start, end - start, {'error': True} if error else None)
+        for reply in self._replies(result):
+            if hasattr(reply, 'execution_time'):
+                device_track = self._trace.track(self._address, reply.device_id)
+                # the devices only report the execution time, so the span is assumed to end with the call
+                self._trace.add(name, device_track, end - reply.execution_time / 1e6, reply.execution_time / 1e6,
+                                {'estimated': True, 'execution_time': reply.execution_time})
+
+@contextmanager
+def trace(file_path, board):
+    """Records the calls of the returned board proxy and writes them to a Chrome trace file"""
+    chrome_trace = ChromeTrace()
+    try:
+        yield TracingBoard(board, chrome_trace)
+    finally:
+        chrome_trace.save(file_path)
+
+
+# In the example, two threads set and measure different channels at the same time:
+
+# In[ ]:
+
+
+from concurrent.futures import ThreadPoolExecutor
+
+def set_and_measure(board, channel_name):
+    for voltage in np.linspace(0, 2, 10):
+        board.set_voltages(voltage, [channel_name])
+        board.measure_channels(wait_for_result=True, sample_count=16, repetitions=1, channel_names=[channel_name])
+
+with trace("idsmu_trace.json", mbX1) as traced_mbX1:
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(lambda channel_name: set_and_measure(traced_mbX1, channel_name), ["channel1", "channel2"]))
+
+
 # Do not forget to shut down the services before proceeding:
 
 # In[42]:
@@ -127,6 +127,118 @@ fig
 #fig.show()
 
 
+# ### Fewer commands per sweep step
+# The `sw_sweep()` function above is easy to read, but every step sends several commands to the hardware:
+# setting the voltage, the measurement and the query of the results.
+# The force value, the settling time and the measurement can also be combined in a single command per device:
+# a list sweep with exactly one step (see the next chapter) forces the value, waits for the measurement delay and measures.
+# The list sweeps of the devices are run in parallel, one thread per device.
+# The list sweep does not support autoranging. If autoranging is enabled for one of the channels,
+# the value is set, the function waits for the settling time and the channels are measured synchronously, so that the results are returned directly without an extra query.
+# 
+# The helper function prepares everything that does not change from step to step once for each combination of channels and settings:
+# whether autoranging is enabled, the list sweeps, the threads that run them and, without autoranging, the current ranges.
+# Repeated calls for the same channels then only change the force values. With autoranging, the current ranges are read after each measurement.
+# *(Note: after changing the current ranges or the autoranging of the channels, the prepared state has to be discarded with `prepared_sweeps.clear()`)*
+
+# In[ ]:
+
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+prepared_sweeps = {}
+
+def device_ids_of_channels(board):
+    """Returns a dictionary that maps the ids and names of all channels on the board to their device id"""
+    device_ids = {}
+    for device in board.get_slots():
+        for channel_id in device.channel_ids:
+            device_ids[channel_id] = device.hardware_id
+            device_ids[board.get_channel_name(channel_id)] = device.hardware_id
+    return device_ids
+
+class PreparedForceAndMeasure:
+    """The list sweeps, the threads and the state of the channels used by force_and_measure()"""
+    def __init__(self, board, channel_names, sample_count, settle_us):
+        self.autorange = any(board.is_autorange_enabled(channel_name) for channel_name in channel_names)
+        self.sweeps = {}
+        self.configurations = {}
+        self.channel_devices = {}
+        self.current_ranges = None
+        self.executor = None
+        if self.autorange:
+            return
+        device_ids = device_ids_of_channels(board)
+        for channel_name in channel_names:
+            device_id = self.channel_devices[channel_name] = device_ids[channel_name]
+            if device_id not in self.sweeps:
+                self.sweeps[device_id] = ListSweep(device_id, board)
+                self.sweeps[device_id].set_sample_count(sample_count)
+                self.sweeps[device_id].set_measurement_delay(settle_us)
+            self.configurations[channel_name] = ListSweepChannelConfiguration()
+            self.configurations[channel_name].force_values = np.zeros(1)
+            self.sweeps[device_id].add_channel_configuration(channel_name, self.configurations[channel_name])
+        # without autoranging, the current ranges do not change during the measurements
+        self.current_ranges = [board.get_current_range(channel_name) for channel_name in channel_names]
+        self.executor = ThreadPoolExecutor(max_workers=len(self.sweeps))
+
+def prepare_force_and_measure(board, channel_names, sample_count, settle_us):
+    key = (board.get_address(), tuple(channel_names), sample_count, settle_us)
+    if key not in prepared_sweeps:
+        prepared_sweeps[key] = PreparedForceAndMeasure(board, channel_names, sample_count, settle_us)
+    return prepared_sweeps[key]
+
+def force_and_measure(board, values, channel_names, sample_count=1, settle_us=0):
+    """Forces the value(s), waits settle_us microseconds and measures the channels.
+    values is a single value or an array with one value per channel.
+    Returns the measured values and the current ranges, both in the order of channel_names"""
+    values = np.broadcast_to(np.asarray(values, dtype=np.float64), (len(channel_names),))
+    prepared = prepare_force_and_measure(board, channel_names, sample_count, settle_us)
+    if prepared.autorange:
+        for value in np.unique(values):
+            board.set_output_force_values(value, [name for name, v in zip(channel_names, values) if v == value])
+        time.sleep(settle_us / 1e6)
+        readings = {}
+        for result in board.measure_channels(wait_for_result=True, sample_count=sample_count, repetitions=1,
+                                             channel_names=channel_names):
+            if result.is_error():
+                raise RuntimeError(result.to_json())
+            for channel_id, channel_name in zip(result.channel_ids, result.channel_names):
+                readings[channel_id] = readings[channel_name] = result[channel_id][0]
+        measured_values = np.array([readings[channel_name] for channel_name in channel_names])
+        return measured_values, [board.get_current_range(channel_name) for channel_name in channel_names]
+    for channel_name, value in zip(channel_names, values):
+        prepared.configurations[channel_name].force_values = np.array([value])
+    errors = list(prepared.executor.map(lambda sweep: sweep.run(), prepared.sweeps.values()))
+    for error in errors:
+        if error:
+            raise RuntimeError(error)
+    measured_values = np.array([prepared.sweeps[prepared.channel_devices[channel_name]].get_measurement_result(channel_name)[0]
+                                for channel_name in channel_names])
+    return measured_values, prepared.current_ranges
+
+
+# The software sweep with the combined command then looks like this:
+
+# In[ ]:
+
+
+def sw_sweep_combined(start, stop, step, settle_us=100):
+    force_values = np.arange(start,stop+step, step)
+    results = np.zeros((len(force_values), len(channel_list)))
+    ranges = []
+    for i, voltage in enumerate(force_values):
+        results[i], current_ranges = force_and_measure(mbX1, voltage, channel_list, sample_count=1, settle_us=settle_us)
+        ranges.append([current_range.name for current_range in current_ranges])
+    return (force_values, results[:, 0], results[:, 1], [r[0] for r in ranges], [r[1] for r in ranges])
+
+mbX1.enable_autorange(False, channel_list)
+mbX1.set_current_ranges(CurrentRange.Range_2mA_SMU, channel_list)
+sweep_combined = sw_sweep_combined(1, 4, 0.2)
+print(sweep_combined[1])
+
+
 # In[16]:
 
 
@@ -285,6 +285,143 @@ fig
 #fig.show()
 
 
+# #### Deriving the current range schedule from a pilot sweep
+# Finding the switching points by looking at a plot is fine for a single DUT, but not for a production flow.
+# The switching points can also be derived from a fast *pilot* sweep: the sweep is run once in a wide current range,
+# and for every step the smallest current range is selected that covers the measured current.
+# A few rules keep the schedule robust:
+# - `headroom`: a range is only used up to this fraction of its full scale
+# - `hysteresis`: switching back to a smaller range requires the current to drop below this fraction of the usable scale of the smaller range, so that noise around a range limit does not cause toggling
+# - `settling_steps`: every range switch needs some time to settle. A range must be held for at least this number of steps, shorter segments are merged into the larger neighbouring range
+# 
+# The full scale values below are those of the SMU current ranges (for DPS modules, the `_DPS` ranges must be used instead):
+
+# In[ ]:
+
+
+import json
+
+# full scale values of the SMU current ranges in ampere, from the smallest to the largest range
+SMU_CURRENT_RANGES = [(CurrentRange.Range_5uA, 5e-6), (CurrentRange.Range_20uA_SMU, 20e-6),
+                      (CurrentRange.Range_200uA_SMU, 200e-6), (CurrentRange.Range_2mA_SMU, 2e-3),
+                      (CurrentRange.Range_70mA_SMU, 70e-3)]
+
+def derive_current_range_schedule(currents, headroom=0.8, hysteresis=0.5, settling_steps=2,
+                                  current_ranges=SMU_CURRENT_RANGES):
+    """Returns a list of (step_index, CurrentRange) tuples. The first entry (step 0) is the start range."""
+    limits = np.array([limit for _, limit in current_ranges]) * headroom
+    currents = np.abs(np.asarray(currents))
+    if currents.size == 0:
+        raise ValueError('The pilot sweep returned no currents')
+    # smallest range that covers the current of each step (the largest range if none does)
+    required = np.minimum(np.searchsorted(limits, currents), len(limits) - 1)
+    ranges = np.empty(len(currents), dtype=int)
+    active = required[0]
+    for i, current in enumerate(currents):
+        if required[i] > active:
+            active = required[i]
+        elif required[i] < active:
+            # switching down only below the hysteresis threshold of the smaller range
+            lower = np.searchsorted(limits * hysteresis, current)
+            active = max(min(lower, active), required[i])
+        ranges[i] = active
+    # a range must be held for settling_steps: shorter segments are merged with their neighbour
+    # with the larger range, using the larger of both ranges so that no step is measured out of range
+    while True:
+        bounds = np.flatnonzero(np.diff(ranges)) + 1
+        segments = list(zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(ranges)]))))
+        short = [k for k, (start, end) in enumerate(segments) if end - start < settling_steps]
+        if len(segments) == 1 or not short:
+            break
+        k = short[0]
+        n = max((n for n in (k - 1, k + 1) if 0 <= n < len(segments)), key=lambda n: ranges[segments[n][0]])
+        start, end = min(segments[k][0], segments[n][0]), max(segments[k][1], segments[n][1])
+        ranges[start:end] = max(ranges[segments[k][0]], ranges[segments[n][0]])
+    return [(int(start), current_ranges[ranges[start]][0]) for start, _ in segments]
+
+
+# The pilot is the same sweep object run once in a wide current range with a sample count of 1.
+# The results of an earlier run can also be reused by passing them directly to `derive_current_range_schedule()`.
+# The schedule is then applied to the channel configurations: the start range is set with the board method,
+# the switching points with `change_current_range_at()`:
+
+# In[ ]:
+
+
+def pilot_current_range_schedules(board, sweep, configurations, pilot_range=CurrentRange.Range_70mA_SMU, **kwargs):
+    """Runs the sweep once in the pilot range and returns a schedule for each channel name in configurations"""
+    for configuration in configurations.values():
+        configuration.clear_current_ranges()
+    board.set_current_ranges(pilot_range, list(configurations))
+    sweep.set_sample_count(1)
+    error = sweep.run()
+    if error:
+        raise RuntimeError(error)
+    return {channel_name: derive_current_range_schedule(sweep.get_measurement_result(channel_name), **kwargs)
+            for channel_name in configurations}
+
+def apply_current_range_schedules(board, configurations, schedules):
+    for channel_name, schedule in schedules.items():
+        configuration = configurations[channel_name]
+        configuration.clear_current_ranges()
+        board.set_current_ranges(schedule[0][1], [channel_name])
+        for step_index, current_range in schedule[1:]:
+            configuration.change_current_range_at(step_index, current_range)
+
+configurations = {"LED2": config_ch2}
+sweep.set_measurement_delay(500)
+schedules = pilot_current_range_schedules(mbX1, sweep, configurations)
+print({channel_name: [(step, rng.name) for step, rng in schedule] for channel_name, schedule in schedules.items()})
+
+mbX1.set_voltages(1, channel_list)
+apply_current_range_schedules(mbX1, configurations, schedules)
+sweep.run()
+fig = create_fig()
+fig
+#uncomment in pure python script:
+#fig.show()
+
+
+# The schedule only depends on the type of DUT and the sweep, so it can be stored and reused for all DUTs of the same type.
+# Later sweeps then run with the correct current ranges the first time, without a pilot sweep.
+# The current ranges are stored with their enum names:
+
+# In[ ]:
+
+
+def save_current_range_schedules(file_path, dut_type, schedules):
+    try:
+        with open(file_path) as file:
+            cache = json.load(file)
+    except FileNotFoundError:
+        cache = {}
+    cache[dut_type] = {channel_name: [[step, rng.name] for step, rng in schedule] for channel_name, schedule in schedules.items()}
+    with open(file_path, "w") as file:
+        json.dump(cache, file, indent=2)
+
+def load_current_range_schedules(file_path, dut_type):
+    """Returns the stored schedules for the DUT type or None if there are none"""
+    try:
+        with open(file_path) as file:
+            cache = json.load(file)
+    except FileNotFoundError:
+        return None
+    if dut_type not in cache:
+        return None
+    return {channel_name: [(step, CurrentRange.__members__[name]) for step, name in schedule]
+            for channel_name, schedule in cache[dut_type].items()}
+
+schedule_file = "current_range_schedules.json"
+save_current_range_schedules(schedule_file, "LED_with_series_resistor", schedules)
+
+# in a later session, the pilot sweep is only needed for DUT types without a stored schedule
+stored_schedules = load_current_range_schedules(schedule_file, "LED_with_series_resistor")
+if stored_schedules is None:
+    stored_schedules = pilot_current_range_schedules(mbX1, sweep, configurations)
+    save_current_range_schedules(schedule_file, "LED_with_series_resistor", stored_schedules)
+apply_current_range_schedules(mbX1, configurations, stored_schedules)
+
+
 # #### Constant force mode and sweep reusage
 # Sweeps can be repeated as often as required.  
 # The parameters can remain the same or be changed between two runs.  
@@ -320,6 +457,104 @@ fig
 #fig.show()
 
 
+# #### Arbitrary waveforms from numpy arrays
+# The force values of a channel configuration can be any numpy array, so a list sweep can also be used as an arbitrary waveform generator
+# for several channels of one module. In contrast to the function generator, the results are returned as numpy arrays.
+# The helper function below configures the sweep once and then replays it as often as required.
+# The measured values and the timecodes of the steps (in µs) are returned as numpy arrays with one row per repetition.
+# The timecodes of a sweep start at the beginning of the sweep, so the timecodes of each chunk are continued from the last timecode of the previous chunk.
+# As the memory for the sweep is limited, long waveforms are split into chunks that fit into the memory (see `can_run()`).
+# Please note that the output holds the last value of a chunk until the next chunk is started.
+
+# In[ ]:
+
+
+def create_waveform_sweeps(board, device_name, waveforms, step_delay):
+    """Returns (sweep, configurations) tuples for the waveforms (channel name -> array of equal length),
+    split into chunks that can be run"""
+    lengths = {channel_name: len(waveform) for channel_name, waveform in waveforms.items()}
+    if len(set(lengths.values())) != 1:
+        raise ValueError(f'The waveforms must have the same length: {lengths}')
+    number_of_steps = lengths.popitem()[1]
+    chunk_size = number_of_steps
+    while chunk_size > 0:
+        chunks = []
+        for start in range(0, number_of_steps, chunk_size):
+            sweep = ListSweep(device_name, board)
+            configurations = []
+            for channel_name, waveform in waveforms.items():
+                configuration = ListSweepChannelConfiguration()
+                configuration.force_values = np.ascontiguousarray(waveform[start:start + chunk_size], dtype=np.float64)
+                sweep.add_channel_configuration(channel_name, configuration)
+                configurations.append(configuration)
+            sweep.set_measurement_delay(step_delay)
+            chunks.append((sweep, configurations))
+        if all(sweep.can_run() for sweep, _ in chunks):
+            return chunks
+        chunk_size //= 2
+    raise RuntimeError("The waveforms do not fit into the sweep memory")
+
+def run_waveform_sweeps(chunks, channel_names, repetitions=1):
+    """Runs the sweeps and returns the results for each channel and the timecodes (in µs),
+    each as array with one row per repetition"""
+    if not channel_names:
+        raise ValueError('No channel names given')
+    number_of_steps = sum(len(configurations[0].force_values) for _, configurations in chunks)
+    results = {channel_name: np.empty((repetitions, number_of_steps)) for channel_name in channel_names}
+    timecodes = np.empty((repetitions, number_of_steps))
+    for repetition in range(repetitions):
+        offset = 0
+        for sweep, _ in chunks:
+            error = sweep.run()
+            if error:
+                raise RuntimeError(error)
+            for channel_name in channel_names:
+                values = sweep.get_measurement_result(channel_name)
+                results[channel_name][repetition, offset:offset + len(values)] = values
+            # the timecodes of each chunk start again at the start of the chunk, they are continued from the end of the previous chunk
+            chunk_start = timecodes[repetition, offset - 1] if offset else 0
+            timecodes[repetition, offset:offset + len(values)] = chunk_start + np.asarray(sweep.timecode)
+            offset += len(values)
+    return results, timecodes
+
+
+# A list sweep has a single measurement delay for all steps.
+# Different delays for each step can be emulated by holding a value for several steps, if the delays are multiples of a common base delay.
+# The indices of the last measurement of each original step are returned as well, so that the results can be reduced to one value per step again:
+
+# In[ ]:
+
+
+def expand_step_delays(waveform, step_delays):
+    """Returns the expanded waveform, the base delay and the indices of the last step of each original value"""
+    step_delays = np.asarray(step_delays, dtype=np.int64)
+    if len(step_delays) != len(waveform):
+        raise ValueError(f'{len(step_delays)} step delays given for {len(waveform)} values')
+    if np.any(step_delays <= 0):
+        raise ValueError('The step delays must be positive')
+    base_delay = int(np.gcd.reduce(step_delays))
+    repeats = step_delays // base_delay
+    return np.repeat(waveform, repeats), base_delay, np.cumsum(repeats) - 1
+
+
+# In the example, the first channel generates a sine wave and the second channel a ramp with longer delays at the end.
+# The waveforms are replayed 5 times:
+
+# In[ ]:
+
+
+ramp, base_delay, ramp_steps = expand_step_delays(np.linspace(1, 3, 50), np.where(np.arange(50) < 40, 100, 200))
+sine = 2.5 + 0.5 * np.sin(2 * np.pi * np.arange(len(ramp)) / 30)
+waveforms = {"LED1": sine, "LED2": ramp}
+
+waveform_chunks = create_waveform_sweeps(mbX1, "My_LED_Module", waveforms, base_delay)
+waveform_results, waveform_timecodes = run_waveform_sweeps(waveform_chunks, list(waveforms), repetitions=5)
+print(f'Number of chunks: {len(waveform_chunks)}')
+print(f'Shape of the results: {waveform_results["LED1"].shape}')
+# one value per step of the ramp, averaged over all repetitions
+ramp_currents = waveform_results["LED2"][:, ramp_steps].mean(axis=0)
+
+
 # In[91]:
 
 
@@ -7,8 +7,205 @@
 # This is the 7th introductory overview of programming the Aspect Device Engine Python API.  
 # This document is available as pdf and interactive jupyter notebook.
 # The introduction includes the following objectives:
+# - Triggered measurements
+# - Arming several triggered measurements and reading their results in bulk
+# - Starting measurements on all devices at the same time
+
+# In[ ]:
+
+
+from aspectdeviceengine.enginecore import IdSmuService, IdSmuServiceRunner, IdSmuBoardModel, IdSmuDeviceModel, check_future_is_ready
+import numpy as np
+import time
+from collections import deque
+srunner = IdSmuServiceRunner()
+mbX1 : IdSmuBoardModel = srunner.get_idsmu_service().get_first_board()
+
+
+# ### Triggered measurements
+# With `wait_for_trigger=True`, a measurement is not started immediately, but with the next hardware trigger signal.
+# The measurement command waits in the queue of the device until the trigger arrives:
+
+# In[ ]:
+
+
+mbX1.set_voltages(1.0, ["M1.S1.C1"])
+mbX1.set_enable_channels(True, ["M1.S1.C1"])
+measresults = mbX1.measure_channels(wait_for_result=False, sample_count=1, repetitions=1, channel_names=["M1.S1.C1"], wait_for_trigger=True)
+# ... the trigger signal is applied
+measresult0 = mbX1.get_measurement_results_for_channel("M1.S1.C1")
+print(measresult0["M1.S1.C1"])
+
+
+# ### Arming several triggered measurements
+# If the measurement is armed again only after the result of the last trigger has been read in Python, triggers that follow each other closely are lost.
+# Instead, several triggered measurements can be armed at once: the commands are queued in the device and each command waits for the next trigger.
+# The results are kept by the engine until they are read.  
+# The `TriggeredMeasurements` class below arms the measurements with `measure_channels_async()` of the devices and keeps the returned futures.
+# `harvest()` reads the results of all measurements that have been triggered so far (optionally waiting up to a timeout for all of them)
+# and returns the measured values of each channel as array with one row per trigger, together with the timecode of each row.
+# If a device returned an error, the results of the other measurements are read first and the error is raised afterwards. The results read up to then are kept and returned by the next call of `harvest()`.
+# To detect missed triggers, the timecodes of the devices are enabled (unless `enable_timecodes=False`, e.g. if the counters are already running and must not be restarted).
+# If the trigger period is given, gaps in the timecodes of more than one period are counted as missed triggers.
+# The 32 bit timecode counter overflows about every 43 s, so the gaps are calculated modulo 2<sup>32</sup>.
+# > Note: measurements that are armed but not triggered stay in the queue of the device. They block the following commands of the device until they are triggered
+
+# In[ ]:
+
+
+class TriggeredMeasurements:
+    """Triggered measurements armed in advance on the devices of the channels"""
+    def __init__(self, board : IdSmuBoardModel, channel_names, sample_count=1, trigger_period_us=None, enable_timecodes=True):
+        self.board = board
+        self.sample_count = sample_count
+        self.trigger_period_us = trigger_period_us
+        self.channels = {}
+        for device in board.get_slots():
+            for channel_id in device.channel_ids:
+                if channel_id in channel_names or board.get_channel_name(channel_id) in channel_names:
+                    self.channels.setdefault(device.hardware_id, (device, []))[1].append(channel_id)
+        self.futures = {device_id: deque() for device_id in self.channels}
+        # results that have been read but not returned yet, channel id -> list of (values, timecode)
+        self.rows = {}
+        self.last_timecodes = {}
+        self.missed_triggers = 0
+        if enable_timecodes:
+            for device_id in self.channels:
+                board.enable_timecode(device_id)
+
+    def arm(self, count):
+        for device_id, (device, channel_ids) in self.channels.items():
+            for _ in range(count):
+                self.futures[device_id].append(device.measure_channels_async(self.sample_count, 1, channel_ids, True))
+
+    def pending(self):
+        """Returns the number of armed measurements whose results have not been read yet"""
+        return sum(len(futures) for futures in self.futures.values())
+
+    def harvest(self, timeout=0):
+        """Returns two dictionaries channel id -> array with one row per trigger and channel id -> timecode of each row"""
+        end_time = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < end_time and \
+                not all(check_future_is_ready(future) for futures in self.futures.values() for future in futures):
+            time.sleep(0.001)
+        errors = []
+        for device_id, (device, channel_ids) in self.channels.items():
+            futures = self.futures[device_id]
+            # the measurements of a device are triggered in the order in which they were armed
+            while futures and check_future_is_ready(futures[0]):
+                reply = futures.popleft().get()
+                if reply.is_error():
+                    errors.append(reply.to_json())
+                    continue
+                timecode = int(reply.timecode[0])
+                for channel_id in channel_ids:
+                    self.rows.setdefault(channel_id, []).append((reply[channel_id], timecode))
+                self.count_missed_triggers(device_id, timecode)
+        if errors:
+            # the results read so far stay in self.rows and are returned by the next call
+            raise RuntimeError('\n'.join(errors))
+        rows, self.rows = self.rows, {}
+        values = {channel_id: np.array([row[0] for row in channel_rows]) for channel_id, channel_rows in rows.items()}
+        timecodes = {channel_id: np.array([row[1] for row in channel_rows], dtype=np.uint32) for channel_id, channel_rows in rows.items()}
+        return values, timecodes
+
+    def count_missed_triggers(self, device_id, timecode):
+        # the timecode is counted in units of 10ns by a 32 bit counter
+        last_timecode = self.last_timecodes.get(device_id)
+        self.last_timecodes[device_id] = timecode
+        if last_timecode is not None and self.trigger_period_us:
+            periods = round((timecode - last_timecode) % 2**32 / 100 / self.trigger_period_us)
+            self.missed_triggers += max(periods - 1, 0)
+
+
+# In the example, 100 measurements are armed for a trigger signal with a period of 1 ms. The results are read while the triggers arrive, until all of them have been read or a deadline has passed.
+# Measurements that have not been triggered by then are reported and stay armed in the devices:
+
+# In[ ]:
+
+
+triggered = TriggeredMeasurements(mbX1, ["M1.S1.C1"], sample_count=1, trigger_period_us=1000)
+triggered.arm(100)
+values, timecodes = [], []
+deadline = time.monotonic() + 5.0
+while triggered.pending() and time.monotonic() < deadline:
+    channel_values, channel_timecodes = triggered.harvest(timeout=0.1)
+    values.append(channel_values.get("M1.S1.C1", np.zeros((0, 1))))
+    timecodes.append(channel_timecodes.get("M1.S1.C1", np.zeros(0, dtype=np.uint32)))
+values, timecodes = np.concatenate(values), np.concatenate(timecodes)
+print(f'{len(values)} results, {triggered.missed_triggers} missed triggers')
+if triggered.pending():
+    print(f'{triggered.pending()} measurements not triggered before the deadline')
+
+
+# ### Starting measurements on all devices at the same time
+# A measurement on channels of several devices with `measure_channels()` sends one command per device. The commands are sent one after the other,
+# so the measurements of the devices start with a small offset, as can be seen in the timecodes.
+# To start the measurements of all devices at the same time, a triggered measurement is armed on every device and all devices are started by the same trigger signal.
+# The function below arms the measurements (using the `TriggeredMeasurements` class from above), waits briefly so that the commands have reached the devices,
+# and then calls a function that generates the trigger signal, e.g. via a digital output of the handler or tester that is connected to the trigger input.
+# It returns the measured values and the skew of the devices, i.e. the difference of the first timecode of each device to the earliest one in µs.
+# > Note: the timecode counters of the devices are started one after the other by `enable_timecode()`, so the skew also contains the offset between the counters.
+# > The function therefore does not restart the counters: they must be enabled once before (otherwise the skew has no meaning), and the skew of a measurement without trigger,
+# > which contains the same offset, can be given as `baseline_skew`. It is subtracted, so that only the remaining skew of the triggered start is returned.
 # 
-# **TODO**
+# If not all devices receive the trigger within the timeout, the trigger is fired once more, so that the measurements still armed are completed and do not block the devices, and then an error is raised.
+# There is no way to cancel an armed measurement: if the devices still do not receive the trigger, they must be initialized again
+
+# In[ ]:
+
+
+def timecode_skew(first_timecodes):
+    """Returns the difference of the first timecode of each device to the earliest one in µs"""
+    # the differences are calculated modulo 2**32 (relative to an arbitrary device), as the counters may overflow in between
+    reference = next(iter(first_timecodes.values()))
+    differences = {device_id: (timecode - reference + 2**31) % 2**32 - 2**31 for device_id, timecode in first_timecodes.items()}
+    earliest = min(differences.values())
+    return {device_id: (difference - earliest) / 100 for device_id, difference in differences.items()}
+
+def measure_on_trigger(board : IdSmuBoardModel, channel_names, fire_trigger, sample_count=1, arm_delay=0.01, timeout=1.0, baseline_skew=None):
+    """Arms a triggered measurement on the devices of the channels, fires the trigger and returns the values and the skew in µs.
+    The timecodes of the devices must have been enabled before, the counters are not started here and the skew of counters
+    that are not running has no meaning. The baseline skew (e.g. of a measurement without trigger) is subtracted from the skew"""
+    triggered = TriggeredMeasurements(board, channel_names, sample_count, enable_timecodes=False)
+    triggered.arm(1)
+    time.sleep(arm_delay)
+    fire_trigger()
+    values, _ = triggered.harvest(timeout)
+    if triggered.pending():
+        not_triggered = [device_id for device_id, futures in triggered.futures.items() if futures]
+        # armed measurements cannot be cancelled, the trigger is fired again so that they do not block the devices
+        fire_trigger()
+        triggered.harvest(timeout)
+        if triggered.pending():
+            raise RuntimeError(f'No trigger received by {not_triggered}, the devices must be initialized again')
+        raise RuntimeError(f'No trigger received by {not_triggered}')
+    skew = timecode_skew(triggered.last_timecodes)
+    if baseline_skew is not None:
+        skew = {device_id: device_skew - baseline_skew[device_id] for device_id, device_skew in skew.items()}
+    return values, skew
+
+def fire_trigger():
+    # replace by the function that generates the trigger signal in your setup
+    input('Apply the trigger signal and press enter')
+
+
+# The timecodes of all devices are enabled once, then the first channel of each device is measured, once without trigger and once with trigger.
+# The skew of the measurement without trigger is the baseline of the triggered measurement:
+
+# In[ ]:
+
+
+channel_names = [device.channel_ids[0] for device in mbX1.get_slots()]
+for device in mbX1.get_slots():
+    mbX1.enable_timecode(device.hardware_id)
+measresults = mbX1.measure_channels(wait_for_result=True, sample_count=1, repetitions=1, channel_names=channel_names)
+baseline_skew = timecode_skew({measresult.device_id: int(measresult.timecode[0]) for measresult in measresults})
+print(baseline_skew)
+
+values, skew = measure_on_trigger(mbX1, channel_names, fire_trigger, baseline_skew=baseline_skew)
+print(skew)
+
 
 # In[18]:
 
@@ -121,6 +121,187 @@ print(setting_service.print_settings('M1_test', False, False, 10))
 setting_service.apply_parameter_setting('M1_test', 'M1', False, 'SMU-Channel')
 
 
+# ### Fast lookups in large tables
+# `get_row_index()` and `filter_rows()` search the column for every call.
+# For tables with thousands of rows and many lookups, e.g. for each DUT, it is faster to build an index of a column once.
+# The `TableIndex` class below creates a dictionary value -> row indices for each column the first time it is used.
+# A lookup then takes the same time regardless of the size of the table.
+# Filters with several values (also given as `|`-separated string as for `filter_rows()`) return the matching rows of all values.
+# The values are normalized for the index: numbers are compared by their value (e.g. *1*, *1.0* and *1,0* are the same), surrounding spaces are ignored.
+# Cells changed via `set_cell_value()` of the index are written to the table group and then the index is updated for this cell only.
+# *(Note: if the table group is changed directly, the index must be rebuilt with `clear()`)*
+
+# In[ ]:
+
+
+class TableIndex:
+    """Hash indexes on the columns of an IdqTableGroup, built when a column is used first"""
+    def __init__(self, group : IdqTableGroup):
+        self.group = group
+        self.indexes = {}
+
+    @staticmethod
+    def key(value):
+        value = (value or '').strip()
+        try:
+            return float(value.replace(',', '.'))
+        except ValueError:
+            return value
+
+    def index(self, column):
+        if column not in self.indexes:
+            index = {}
+            for row in range(self.group.shape[0]):
+                index.setdefault(self.key(self.group.at[row, column]), []).append(row)
+            self.indexes[column] = index
+        return self.indexes[column]
+
+    def get_row_index(self, column, value):
+        """Returns the index of the first row with the given value, or -1"""
+        rows = self.index(column).get(self.key(value))
+        return rows[0] if rows else -1
+
+    def filter_rows(self, column, values):
+        """Returns the sorted indexes of the rows with one of the values (list or '|'-separated string)"""
+        if isinstance(values, str):
+            values = values.split('|')
+        index = self.index(column)
+        return sorted(set(row for value in values for row in index.get(self.key(value), [])))
+
+    def set_cell_value(self, row, column, value):
+        old_key = self.key(self.group.at[row, column])
+        # the index is only updated if the value has been written
+        self.group.set_cell_value(row, column, value)
+        if column in self.indexes:
+            index = self.indexes[column]
+            index[old_key].remove(row)
+            if not index[old_key]:
+                del index[old_key]
+            rows = index.setdefault(self.key(value), [])
+            rows.append(row)
+            rows.sort()
+
+    def clear(self):
+        self.indexes.clear()
+
+
+# The index is used for the group loaded above:
+
+# In[ ]:
+
+
+group_index = TableIndex(group)
+print(group_index.get_row_index('HardwareId', 'M1.S1.C2'))
+print(group_index.filter_rows('HardwareId', 'M1.S1.C1|M1.S1.C3'))
+
+group_index.set_cell_value(row_idx[0], 'Name', 'led1')
+print(group_index.filter_rows('Name', ['led1', 'M1.S1.C2']))
+group_index.set_cell_value(row_idx[0], 'Name', 'M1.S1.C1')
+
+
+# ### Typed columns and pandas
+# As all values in a table are strings, every evaluation of a table has to convert the values first.
+# For large tables, e.g. for several MbX-16 boards, it is better to convert a table group once into typed columns.
+# The types are taken from the range descriptors of the group (the type rows at the end of a group in the csv file):
+# `float`, `int` and `bool` columns become numeric numpy arrays. The columns of enumeration types (e.g. the current range) are stored as
+# integer codes together with the list of valid values, strings are stored as string arrays.
+# The typed columns can then be exported to numpy, pandas or Arrow without converting each cell again.
+# Changes made in a pandas `DataFrame` are written back with `from_pandas()`, which only writes the cells that have changed.
+# Numbers are written with a decimal comma like in the csv files. Values of enumeration columns that are not valid values of the enumeration raise a `ValueError` before any cell is written.
+# > Note: `to_arrow()` requires pyarrow, which is not part of the requirements of the tutorials
+
+# In[ ]:
+
+
+import pandas as pd
+
+class TypedTableGroup:
+    """Column oriented copy of an IdqTableGroup with typed columns"""
+    def __init__(self, group : IdqTableGroup):
+        self.group = group
+        self.categories = {}
+        self.columns = {}
+        descriptors = group.get_range_descriptors()
+        rows = group.get_rows()
+        for index, column in enumerate(group.columns):
+            values = [row[index].cell_value or '' for row in rows]
+            self.columns[column] = self.parse(column, values, descriptors.get(column, ['string']))
+
+    def parse(self, column, values, descriptor):
+        if descriptor == ['float']:
+            return np.array([float(value.replace(',', '.')) if value else np.nan for value in values])
+        if descriptor == ['int']:
+            return np.array([int(value) if value else 0 for value in values], dtype=np.int64)
+        if descriptor == ['bool']:
+            return np.array([value == '1' for value in values])
+        if len(descriptor) > 1:
+            self.categories[column] = list(descriptor)
+            codes = {category: code for code, category in enumerate(descriptor)}
+            return np.array([codes.get(value, -1) for value in values], dtype=np.int16)
+        return np.array(values, dtype=object)
+
+    def format(self, column, value):
+        if column in self.categories:
+            return self.categories[column][value]
+        if isinstance(value, (bool, np.bool_)):
+            return '1' if value else '0'
+        if isinstance(value, (float, np.floating)):
+            return '' if np.isnan(value) else str(float(value)).replace('.', ',')
+        return str(value)
+
+    def to_numpy(self):
+        """Returns a copy of the columns as dictionary of numpy arrays (enumeration columns as codes, -1 for invalid or missing values)"""
+        return {column: values.copy() for column, values in self.columns.items()}
+
+    def to_pandas(self):
+        # the code -1 of invalid or missing values becomes NaN
+        data = {column: pd.Categorical.from_codes(values, self.categories[column]) if column in self.categories else values
+                for column, values in self.columns.items()}
+        # the DataFrame gets its own copy of the columns, so that from_pandas() can detect the changes
+        return pd.DataFrame(data)
+
+    def to_arrow(self):
+        import pyarrow as pa
+        return pa.table({column: pa.DictionaryArray.from_arrays(pa.array(values, mask=values < 0), self.categories[column]) if column in self.categories
+                         else pa.array(values) for column, values in self.columns.items()})
+
+    def from_pandas(self, data_frame):
+        """Writes the changed cells of a DataFrame with the same rows and columns back to the table group"""
+        changes = {}
+        for column, values in self.columns.items():
+            if column in self.categories:
+                codes = {category: code for code, category in enumerate(self.categories[column])}
+                new_values = np.array([codes.get(value, -1) for value in data_frame[column]], dtype=np.int16)
+            else:
+                new_values = data_frame[column].to_numpy(dtype=values.dtype)
+            changed = new_values != values
+            if values.dtype.kind == 'f':
+                changed &= ~(np.isnan(new_values) & np.isnan(values))
+            if column in self.categories and np.any(changed & (new_values < 0)):
+                invalid = data_frame[column].to_numpy()[changed & (new_values < 0)]
+                raise ValueError(f'Invalid values for column {column}: {list(invalid)}')
+            changes[column] = (new_values, changed)
+        for column, (new_values, changed) in changes.items():
+            for row in np.flatnonzero(changed):
+                self.group.set_cell_value(int(row), column, self.format(column, new_values[row]))
+            self.columns[column] = new_values
+
+
+# The group of the table loaded above is converted and modified as a `DataFrame`:
+
+# In[ ]:
+
+
+typed_group = TypedTableGroup(group)
+data_frame = typed_group.to_pandas()
+print(data_frame.dtypes)
+
+data_frame.loc[data_frame['HardwareId'] == 'M1.S1.C1', 'OutputForceValue'] = 2.5
+data_frame['EnableOutput'] = True
+typed_group.from_pandas(data_frame)
+print(setting_service.print_settings('M1_test', False, False, 10))
+
+
 # In[42]:
 
 
@@ -125,6 +125,623 @@ mbX1_settings : IdqTable = setting_service.get_parameter_settings_for_board('M1'
 print(setting_service.print_settings(mbX1_settings.name, False, False, 10))
 
 
+# #### Applying only the changed rows
+# When switching between two tables that differ in only a few cells, it is not necessary to write the whole table.
+# The table can be compared with the current state of the board (or with the last applied table) and only the rows that differ are applied.
+# The `apply_parameter_settings_at_column_values()` method applies the rows with the given values in a column,
+# here the hardware ids of the changed rows. The comparison ignores the columns that only describe the row
+# (`SettingId`, `Group`, `Type`) and compares normalized values: numbers are equal if their values are equal (e.g. *0,07* and *0.07*)
+# and empty cells are equal to each other.
+# Like `get_channel_states()` in chapter 3, the function removes the table of the board state that it exports under the board address, unless a table with this name existed before.
+# The function returns a report of the changes for each hardware id, with the old and the new value of each changed cell:
+
+# In[ ]:
+
+
+DESCRIPTIVE_COLUMNS = ('SettingId', 'Group', 'Type')
+
+def normalized_value(value):
+    """Returns the value of a cell as float if it is a number, otherwise as string ('' for an empty cell)"""
+    value = (value or '').strip()
+    try:
+        return float(value.replace(',', '.'))
+    except ValueError:
+        return value
+
+def same_value(value1, value2):
+    return normalized_value(value1) == normalized_value(value2)
+
+def apply_changed_rows(setting_service, setting_name, board_address, table_group_name, reference_setting_name=None,
+                       key_column='HardwareId'):
+    """Applies the rows of a table group that differ from the board state (or from the reference table).
+    Returns a dictionary key -> {column: (old value, new value)} of the applied changes"""
+    table = setting_service.get_parameter_setting(setting_name).get_table_group(table_group_name)
+    remove_reference = False
+    if reference_setting_name is None:
+        remove_reference = board_address not in setting_service.get_parameter_settings_names()
+        reference_table = setting_service.get_parameter_settings_for_board(board_address)
+    else:
+        reference_table = setting_service.get_parameter_setting(reference_setting_name)
+    try:
+        reference = reference_table.get_table_group(table_group_name)
+        reference_rows = {reference.at[row, key_column]: row for row in range(reference.shape[0])}
+        columns = [column for column in table.columns if column in reference.columns
+                   and column != key_column and column not in DESCRIPTIVE_COLUMNS]
+        changes = {}
+        for row in range(table.shape[0]):
+            key = table.at[row, key_column]
+            reference_row = reference_rows.get(key)
+            row_changes = {}
+            for column in columns:
+                old_value = None if reference_row is None else reference.at[reference_row, column]
+                if reference_row is None or not same_value(old_value, table.at[row, column]):
+                    row_changes[column] = (old_value, table.at[row, column])
+            if row_changes:
+                changes[key] = row_changes
+    finally:
+        if remove_reference:
+            setting_service.remove_parameter_setting(reference_table.name)
+    if changes:
+        setting_service.apply_parameter_settings_at_column_values(setting_name, board_address, key_column,
+                                                                  list(changes), False, table_group_name)
+    return changes
+
+
+# As seen above, only the channels 1 and 3 differ from the table, so only these two rows are applied:
+
+# In[ ]:
+
+
+changes = apply_changed_rows(setting_service, 'M1_voltages_set', 'M1', 'SMU-Channel')
+for hardware_id, row_changes in changes.items():
+    print(hardware_id, row_changes)
+
+
+# ### Binary snapshots of tables
+# Large csv files take some time to load, as every line has to be split and converted.
+# For tables that are only read, e.g. to look up the recipe of a DUT at the start of a station, a binary snapshot can be used instead.
+# The snapshot format below stores all cells of a table group as one array of fixed length byte strings.
+# The file starts with a header with a format id, a version and a CRC32 checksum of the content.
+# The names of the tables, groups and columns and the type descriptors are stored as JSON at the end of the file.
+# `load_snapshot()` maps the file into memory with `np.memmap` and returns the arrays of the groups without reading the cells:
+# only the pages of the file that are accessed are read from disk.
+# The checksum is therefore only checked with `verify=True`, as this reads the whole file. The conversion of a snapshot into a csv file (see below) always checks it.
+
+# In[ ]:
+
+
+import itertools, json, struct, zlib
+
+SNAPSHOT_MAGIC = b'IDQSNAP1'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<8sIIQQ')
+
+def descriptor_to_string(descriptor):
+    return '[' + ','.join(descriptor) + ']' if len(descriptor) > 1 else ''.join(descriptor)
+
+def write_snapshot(file_path, tables):
+    """Writes tables given as (table name, [(group name, columns, descriptors, rows)]) to a snapshot file"""
+    metadata = []
+    crc = 0
+    with open(file_path, 'wb') as file:
+        file.write(bytes(SNAPSHOT_HEADER.size))
+        for table_name, groups in tables:
+            table_metadata = {'name': table_name, 'groups': []}
+            for group_name, columns, descriptors, rows in groups:
+                cells = np.char.encode(np.array(rows, dtype=str).reshape(len(rows), len(columns)), 'utf-8')
+                cells = cells.astype(f'S{max(cells.itemsize, 1)}')
+                table_metadata['groups'].append({'name': group_name, 'columns': columns, 'descriptors': descriptors,
+                                                 'dtype': cells.dtype.str, 'shape': cells.shape, 'offset': file.tell()})
+                data = cells.tobytes() + bytes(-cells.nbytes % 8)
+                crc = zlib.crc32(data, crc)
+                file.write(data)
+            metadata.append(table_metadata)
+        metadata_offset = file.tell()
+        data = json.dumps(metadata).encode('utf-8')
+        crc = zlib.crc32(data, crc)
+        file.write(data)
+        file.seek(0)
+        file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, crc, metadata_offset, len(data)))
+
+def save_snapshot(tables : list[IdqTable], file_path):
+    def groups(table):
+        for group in table.table_groups:
+            descriptors = group.get_range_descriptors()
+            rows = [[cell.cell_value or '' for cell in row] for row in group.get_rows()]
+            yield (group.name, group.columns, [descriptor_to_string(descriptors.get(column, ['string'])) for column in group.columns], rows)
+    write_snapshot(file_path, ((table.name, groups(table)) for table in tables))
+
+def load_snapshot(file_path, verify=False):
+    """Maps a snapshot file into memory and returns a dictionary table name -> group name -> group.
+    With verify=True the checksum of the whole file is checked"""
+    memory = np.memmap(file_path, dtype=np.uint8, mode='r')
+    magic, version, crc, metadata_offset, metadata_length = SNAPSHOT_HEADER.unpack(memory[:SNAPSHOT_HEADER.size])
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise RuntimeError(f'{file_path} is not a snapshot of version {SNAPSHOT_VERSION}')
+    if verify and zlib.crc32(memory[SNAPSHOT_HEADER.size:]) != crc:
+        raise RuntimeError(f'Checksum error in {file_path}')
+    tables = {}
+    for table in json.loads(bytes(memory[metadata_offset:metadata_offset + metadata_length])):
+        tables[table['name']] = groups = {}
+        for group in table['groups']:
+            group['cells'] = np.ndarray(group['shape'], dtype=group['dtype'], buffer=memory, offset=group['offset'])
+            groups[group['name']] = group
+    return tables
+
+def snapshot_column(group, column):
+    """Returns the values of a column of a snapshot group as strings"""
+    return np.char.decode(group['cells'][:, group['columns'].index(column)], 'utf-8')
+
+
+# The table exported at the beginning of this chapter is stored as snapshot and read again:
+
+# In[ ]:
+
+
+snapshot_path = os.path.join(os.path.abspath(""), "M1_voltages_set.idqsnap")
+save_snapshot([setting_service.get_parameter_setting('M1_voltages_set')], snapshot_path)
+snapshot = load_snapshot(snapshot_path)
+smu_channels = snapshot['M1_voltages_set']['SMU-Channel']
+print(smu_channels['columns'])
+print(snapshot_column(smu_channels, 'OutputForceValue'))
+
+
+# #### Converting between csv files and snapshots
+# The csv importer below reads a csv file line by line and returns the groups one after the other,
+# so that only one group of a large file is held in memory. Malformed files (no groups, rows with more or fewer cells than columns) raise a `ValueError`.
+# It is used to convert a csv file into a snapshot. The conversion from a snapshot into a csv file writes the format of `export_settings_to_csv()`.  
+# `import_snapshot()` loads a snapshot into the settings service. Tables that already exist in the service with the same groups, columns and number of rows
+# are updated with `set_cell_value()`, only the cells that differ are written, so no text file is parsed.
+# The settings service can only create new tables from files, so tables that do not exist yet are imported via a temporary csv file:
+
+# In[ ]:
+
+
+def read_csv_groups(file_path, delimiter=';'):
+    """Reads a table file line by line and yields (table name, group name, columns, descriptors, rows) for each group"""
+    table_name = group_name = columns = descriptors = None
+    rows = []
+    group_count = 0
+    def row_cells(cells, line_number):
+        if len(cells) < len(columns) or any(cells[len(columns):]):
+            raise ValueError(f'{file_path}, line {line_number}: {len(cells)} cells for {len(columns)} columns')
+        return cells[:len(columns)]
+    # utf-8-sig skips the byte order mark written e.g. by Excel
+    with open(file_path, encoding='utf-8-sig') as file:
+        for line_number, line in enumerate(file, 1):
+            cells = line.rstrip('\r\n').split(delimiter)
+            if descriptors == []:
+                descriptors = row_cells(cells, line_number)
+            elif cells[0] == '[Types]':
+                descriptors = []
+                continue
+            elif not any(cells):
+                continue
+            elif cells[0].startswith('[') or cells[0].startswith('#'):
+                if columns is not None:
+                    group_count += 1
+                    yield table_name, group_name, columns, descriptors or ['string'] * len(columns), rows
+                if cells[0].startswith('['):
+                    table_name = cells[0][1:-1]
+                else:
+                    group_name = cells[0][1:]
+                columns, descriptors, rows = None, None, []
+            elif columns is None:
+                if table_name is None or group_name is None:
+                    raise ValueError(f'{file_path}, line {line_number}: columns before the table and group name')
+                while cells and not cells[-1]:
+                    cells.pop()
+                columns = cells
+            else:
+                rows.append(row_cells(cells, line_number))
+    if columns is not None:
+        group_count += 1
+        yield table_name, group_name, columns, descriptors or ['string'] * len(columns), rows
+    if group_count == 0:
+        raise ValueError(f'{file_path} contains no table groups')
+
+def csv_to_snapshot(csv_path, snapshot_path):
+    tables = itertools.groupby(read_csv_groups(csv_path), key=lambda group: group[0])
+    write_snapshot(snapshot_path, ((table_name, (group[1:] for group in groups)) for table_name, groups in tables))
+
+def snapshot_to_csv(snapshot_path, csv_path, delimiter=';', table_names=None):
+    tables = load_snapshot(snapshot_path, verify=True)
+    if table_names is not None:
+        tables = {table_name: groups for table_name, groups in tables.items() if table_name in table_names}
+    width = max(len(group['columns']) for groups in tables.values() for group in groups.values())
+    def line(cells):
+        return delimiter.join(list(cells) + [''] * (width - len(cells))) + '\n'
+    with open(csv_path, 'w', encoding='utf-8') as file:
+        for table_name, groups in tables.items():
+            file.write(line([f'[{table_name}]']))
+            for index, group in enumerate(groups.values()):
+                if index > 0:
+                    file.write(line([]))
+                file.write(line(['#' + group['name']]))
+                file.write(line(group['columns']))
+                for row in np.char.decode(group['cells'], 'utf-8'):
+                    file.write(line(row))
+                file.write(line(['[Types]']))
+                file.write(line(group['descriptors']))
+
+def update_table_from_snapshot(table : IdqTable, groups):
+    """Writes the cells of the snapshot groups that differ into the table. Returns False (without writing) if the layout differs"""
+    if sorted(table.get_table_group_names()) != sorted(groups):
+        return False
+    table_groups = {group_name: table.get_table_group(group_name) for group_name in groups}
+    for group_name, group in groups.items():
+        if list(table_groups[group_name].columns) != group['columns'] or list(table_groups[group_name].shape) != list(group['shape']):
+            return False
+    for group_name, group in groups.items():
+        table_group = table_groups[group_name]
+        cells = np.char.decode(group['cells'], 'utf-8')
+        for row_index, row in enumerate(table_group.get_rows()):
+            for column_index, cell in enumerate(row):
+                if (cell.cell_value or '') != cells[row_index, column_index]:
+                    table_group.set_cell_value(row_index, column_index, str(cells[row_index, column_index]))
+    return True
+
+def import_snapshot(setting_service, snapshot_path):
+    """Loads the tables of a snapshot into the settings service and returns their names"""
+    tables = load_snapshot(snapshot_path, verify=True)
+    existing_names = setting_service.get_parameter_settings_names()
+    new_names = [table_name for table_name, groups in tables.items()
+                 if table_name not in existing_names
+                 or not update_table_from_snapshot(setting_service.get_parameter_setting(table_name), groups)]
+    if new_names:
+        csv_path = os.path.splitext(snapshot_path)[0] + '_snapshot.csv'
+        snapshot_to_csv(snapshot_path, csv_path, table_names=new_names)
+        error = setting_service.import_settings_from_csv(csv_path)
+        if error:
+            raise RuntimeError(error)
+    return list(tables)
+
+csv_to_snapshot(os.path.join(os.path.abspath(""), "M1_voltages_set.csv"), snapshot_path)
+print(list(load_snapshot(snapshot_path)))
+print(import_snapshot(setting_service, snapshot_path))
+print(setting_service.get_parameter_settings_names())
+
+
+# ### Compiling a table for repeated use
+# `apply_parameter_setting()` converts and checks all cells of a table every time it is called.
+# If the same table is applied to many DUTs, this work can be done once.
+# The `CompiledSetting` class below checks the cells against the type descriptors of the table and converts them once:
+# the force values, the output and clamp switches and the clamp values of the channels are converted to numbers and grouped by value,
+# so that `apply()` sets them with one typed board method call per distinct value (e.g. `set_output_force_values()`) without converting any strings.
+# The other parameters (e.g. the enumeration values and the parameters of the devices) are set with `set_analog_device_parameters_from_strings()`.
+# All parameters are set with the immediate mode disabled and written with one command per device by `write_uncommited_settings()`.
+# The hardware ids in the table belong to one board, so the address of this board is given when the table is compiled and `apply()` rejects other boards.  
+# A compiled table remembers a checksum of the cells, which is calculated from the rows read with `get_rows()`.
+# `apply()` compares it by default and raises an error if the table has been changed since it was compiled; `compile_setting()` compiles the table again in this case.
+# With `check=False`, the check is skipped, e.g. in a loop in which the table is certainly not changed:
+
+# In[ ]:
+
+
+compiled_settings = {}
+
+# columns of the channel tables that are set with typed board methods: column -> (method, conversion)
+TYPED_COLUMNS = {'OutputForceValue': ('set_output_force_values', lambda value: float(value.replace(',', '.'))),
+                 'EnableOutput': ('set_enable_channels', lambda value: value == '1'),
+                 'EnableClamps': ('set_enable_clamps', lambda value: value == '1')}
+CLAMP_COLUMNS = ('ClampLowValue', 'ClampHighValue')
+
+def table_rows(table : IdqTable):
+    """Returns the rows of all groups of the table as lists of strings, read with one get_rows() call per group"""
+    return {group.name: [[cell.cell_value or '' for cell in row] for row in group.get_rows()] for group in table.table_groups}
+
+def table_checksum(rows):
+    checksum = 0
+    for group_name, group_rows in rows.items():
+        checksum = zlib.crc32(group_name.encode('utf-8'), checksum)
+        for row in group_rows:
+            checksum = zlib.crc32(';'.join(row).encode('utf-8'), checksum)
+    return checksum
+
+def check_cell_value(value, descriptor):
+    if descriptor == ['float']:
+        float(value.replace(',', '.'))
+    elif descriptor == ['int']:
+        int(value)
+    elif descriptor == ['bool']:
+        if value not in ('0', '1'):
+            raise ValueError(f'{value} is not a bool value')
+    elif len(descriptor) > 1 and value not in descriptor:
+        raise ValueError(f'{value} is not one of {descriptor}')
+
+class CompiledSetting:
+    """Checked parameters of a table, grouped by channel or device"""
+    def __init__(self, setting_service, setting_name, board_address, filtered=False):
+        self.setting_service = setting_service
+        self.setting_name = setting_name
+        self.board_address = board_address
+        self.filtered = filtered
+        table = self.get_table()
+        rows = table_rows(table)
+        self.checksum = table_checksum(rows)
+        typed_calls = {}
+        self.parameters = []
+        for group in table.table_groups:
+            descriptors = group.get_range_descriptors()
+            column_names = list(group.columns)
+            columns = [column for column in column_names
+                       if column not in DESCRIPTIVE_COLUMNS and column not in ('HardwareId', 'Name')]
+            for row_index, row in enumerate(rows[group.name]):
+                cells = dict(zip(column_names, row))
+                hardware_id = cells['HardwareId']
+                names, values = [], []
+                for column in columns:
+                    value = cells[column]
+                    if value:
+                        try:
+                            check_cell_value(value, descriptors.get(column, ['string']))
+                        except ValueError as error:
+                            raise ValueError(f'{setting_name}, {group.name}, row {row_index}, {column}: {error}')
+                        if column in TYPED_COLUMNS:
+                            method, convert = TYPED_COLUMNS[column]
+                            typed_calls.setdefault((method, (convert(value),)), []).append(hardware_id)
+                        elif column not in CLAMP_COLUMNS or not all(cells.get(clamp) for clamp in CLAMP_COLUMNS):
+                            names.append(column)
+                            values.append(value)
+                if all(cells.get(clamp) for clamp in CLAMP_COLUMNS):
+                    clamps = tuple(float(cells[clamp].replace(',', '.')) for clamp in CLAMP_COLUMNS)
+                    typed_calls.setdefault(('set_clamps_low_and_high_values', clamps), []).append(hardware_id)
+                if names:
+                    self.parameters.append((hardware_id, names, values))
+        self.typed_calls = [(method, arguments, channel_ids) for (method, arguments), channel_ids in typed_calls.items()]
+
+    def get_table(self):
+        table = self.setting_service.get_parameter_setting(self.setting_name)
+        return table.get_filtered_table() if self.filtered else table
+
+    def is_valid(self):
+        return table_checksum(table_rows(self.get_table())) == self.checksum
+
+    def apply(self, board, check=True):
+        """Writes the parameters to the board with one command per device.
+        With check=False, the table is not compared with the compiled parameters"""
+        if board.get_address() != self.board_address:
+            raise ValueError(f'The table {self.setting_name} is compiled for board {self.board_address}, not for {board.get_address()}')
+        if check and not self.is_valid():
+            raise RuntimeError(f'The table {self.setting_name} has been changed since it was compiled')
+        immediate_mode = board.get_immediate_mode()
+        board.set_immediate_mode(False)
+        try:
+            for method, arguments, channel_ids in self.typed_calls:
+                getattr(board, method)(*arguments, channel_ids)
+            for resource_id, names, values in self.parameters:
+                board.set_analog_device_parameters_from_strings(resource_id, names, values)
+        finally:
+            board.set_immediate_mode(immediate_mode)
+        return board.write_uncommited_settings(True)
+
+def compile_setting(setting_service, setting_name, board_address, filtered=False):
+    """Returns the compiled table, compiles it again if the table has been changed"""
+    key = (setting_name, board_address, filtered)
+    compiled = compiled_settings.get(key)
+    if compiled is None or not compiled.is_valid():
+        compiled = compiled_settings[key] = CompiledSetting(setting_service, setting_name, board_address, filtered)
+    return compiled
+
+
+# The table `M1_voltages_set` is compiled and applied for several DUTs. After a change of the table, it is compiled again:
+
+# In[ ]:
+
+
+compiled = compile_setting(setting_service, 'M1_voltages_set', mbX1.get_address())
+for dut in range(3):
+    compiled.apply(mbX1, check=False)
+    # ... measure the DUT
+
+voltages = setting_service.get_parameter_setting('M1_voltages_set').get_table_group('SMU-Channel')
+voltages.at[0, 'OutputForceValue'] = '1.5'
+print(compiled.is_valid())
+compile_setting(setting_service, 'M1_voltages_set', mbX1.get_address()).apply(mbX1)
+print(mbX1.idSmu2Modules['M1.S1'].smu.channels['M1.S1.C1'].voltage)
+
+
+# ### Keeping a table up to date
+# `get_parameter_settings_for_board()` and `refresh_table()` read the state of all channels and devices of the board.
+# If a table is to reflect the state of the board at any time, it is sufficient to refresh only the rows of the channels and devices that have changed.
+# A `ParamterChangedObserverProxy` calls a Python function whenever a parameter of a channel or device changes.
+# The `LiveTable` class below registers an observer for every channel and device of the board, which notes the id of the changed resource.
+# The observers are registered before the table is read, so that no change is lost in between (a change during the reading only causes an extra refresh of the row).
+# `refresh()` then refreshes only the noted rows with `refresh_table_row()`.
+# The observers are removed with `close()` or at the end of a `with` block.
+# *(Note: the observer functions may be called by another thread, hence the lock)*
+
+# In[ ]:
+
+
+import threading
+from aspectdeviceengine.enginecore import ParamterChangedObserverProxy
+
+class LiveTable:
+    """Table of the board state that refreshes only the rows of changed channels and devices"""
+    def __init__(self, setting_service, board : IdSmuBoardModel, table_name):
+        self.setting_service = setting_service
+        self.table_name = table_name
+        self.changed = set()
+        self.lock = threading.Lock()
+        self.observers = []
+        for device in board.get_slots():
+            for resource_id in [device.hardware_id] + list(device.channel_ids):
+                observer = ParamterChangedObserverProxy()
+                observer.register_observer(board, resource_id, lambda resource_id=resource_id: self.notify(resource_id))
+                self.observers.append(observer)
+        # the table is read after the observers are registered, so that no change is missed
+        self.table : IdqTable = setting_service.get_parameter_settings_for_board(board.get_address())
+        self.table.name = table_name
+
+    def notify(self, resource_id):
+        with self.lock:
+            self.changed.add(resource_id)
+
+    def refresh(self):
+        """Refreshes the rows of the changed resources and returns their ids"""
+        with self.lock:
+            changed, self.changed = self.changed, set()
+        for resource_id in sorted(changed):
+            self.setting_service.refresh_table_row(self.table_name, 'HardwareId', resource_id)
+        return sorted(changed)
+
+    def close(self):
+        for observer in self.observers:
+            observer.unregister_observer()
+        self.observers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+# Only the row of the changed channel is refreshed:
+
+# In[ ]:
+
+
+with LiveTable(setting_service, mbX1, 'M1_live') as live_table:
+    mbX1.idSmu2Modules['M1.S1'].smu.channels['M1.S1.C2'].voltage = 2.5
+    print(live_table.refresh())
+    print(setting_service.print_settings('M1_live', False, False, 10))
+
+
+# ### Applying a table to several boards
+# `apply_parameter_setting()` and `apply_parameter_settings_at_column_values()` apply a table to one board.
+# To configure all boards of a rack, the calls for the boards can be made in parallel threads.
+# The function below applies a table to the given boards (by default to all boards) and immediately returns a `Future`.
+# Its result is a dictionary with the number of resources the table was applied to for each board address.
+# If the table could not be applied to a board, the exception is returned for this board instead, so that the other boards are not affected.
+# With `column_name` and `column_values`, only the rows with these values are applied, as with `apply_parameter_settings_at_column_values()`:
+
+# In[ ]:
+
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+board_executor = ThreadPoolExecutor(max_workers=8)
+
+def apply_to_boards(setting_service, setting_name, board_addresses=None, filtered=False, table_group_name=None,
+                    column_name=None, column_values=None) -> Future:
+    """Applies a table to several boards in parallel. The future returns a dictionary board address -> result"""
+    if board_addresses is None:
+        board_addresses = srunner.get_idsmu_service().get_board_addresses()
+    def apply(board_address):
+        if column_name is None:
+            return setting_service.apply_parameter_setting(setting_name, board_address, filtered, table_group_name)
+        return setting_service.apply_parameter_settings_at_column_values(setting_name, board_address, column_name,
+                                                                         column_values, filtered, table_group_name)
+    futures = {board_address: board_executor.submit(apply, board_address) for board_address in board_addresses}
+    results = Future()
+    lock = threading.Lock()
+    def board_done(_):
+        with lock:
+            if results.done() or not all(future.done() for future in futures.values()):
+                return
+            results.set_result({board_address: future.exception() or future.result()
+                                for board_address, future in futures.items()})
+    for future in futures.values():
+        future.add_done_callback(board_done)
+    if not futures:
+        results.set_result({})
+    return results
+
+
+# In[ ]:
+
+
+future = apply_to_boards(setting_service, 'M1_voltages_set', table_group_name='SMU-Channel')
+# ... other work
+for board_address, result in future.result().items():
+    print(board_address, result)
+
+
+# ### Saving and re-applying the state of the boards
+# The initialization of the devices resets all channels. To get back to a known configuration after the boards have been initialized again,
+# the state of the boards can be saved (e.g. after each configuration step), re-applied and verified.
+# This does not resume a running setup without a reset: the API offers no way to attach to running hardware without initializing the devices
+# (`get_first_board()` and `detect_devices()` initialize them), so the saved tables are applied again after the initialization.
+# `save_board_state()` exports the state of all boards into one csv file, with one table named *board address* + *_state* per board.
+# The file is first written under a temporary name and then renamed, so that a crash while writing does not leave an incomplete file.  
+# `reapply_board_state()` loads the file and applies the tables to the initialized boards. An error is raised if the table could not be applied to all of its rows.
+# Then `verify_board_state()` compares the normalized values of the state of each board with its table (see `same_value()` above), the differences are returned per board.
+
+# In[ ]:
+
+
+def save_board_state(srunner, file_path):
+    service : IdSmuService = srunner.get_idsmu_service()
+    setting_service = service.get_settings_service()
+    setting_names = []
+    for board_address in service.get_board_addresses():
+        table : IdqTable = setting_service.get_parameter_settings_for_board(board_address)
+        table.name = board_address + '_state'
+        setting_names.append(table.name)
+    error = setting_service.export_settings_to_csv(file_path + '.tmp', setting_names, False)
+    if error:
+        raise RuntimeError(error)
+    os.replace(file_path + '.tmp', file_path)
+
+def verify_board_state(setting_service, setting_name, board_address):
+    """Returns a list of (hardware id, column, expected value, actual value) of the differences"""
+    differences = []
+    expected_table = setting_service.get_parameter_setting(setting_name)
+    remove_actual = board_address not in setting_service.get_parameter_settings_names()
+    actual_table = setting_service.get_parameter_settings_for_board(board_address)
+    try:
+        for expected in expected_table.table_groups:
+            actual = actual_table.get_table_group(expected.name)
+            actual_rows = {actual.at[row, 'HardwareId']: row for row in range(actual.shape[0])}
+            for row in range(expected.shape[0]):
+                hardware_id = expected.at[row, 'HardwareId']
+                for column in expected.columns:
+                    if column in DESCRIPTIVE_COLUMNS:
+                        continue
+                    value = None if hardware_id not in actual_rows else actual.at[actual_rows[hardware_id], column]
+                    if hardware_id not in actual_rows or not same_value(expected.at[row, column], value):
+                        differences.append((hardware_id, column, expected.at[row, column], value))
+    finally:
+        if remove_actual:
+            setting_service.remove_parameter_setting(actual_table.name)
+    return differences
+
+def reapply_board_state(srunner, file_path):
+    """Applies the saved state to the initialized boards and returns the differences per board"""
+    service : IdSmuService = srunner.get_idsmu_service()
+    setting_service = service.get_settings_service()
+    error = setting_service.import_settings_from_csv(file_path)
+    if error:
+        raise RuntimeError(error)
+    differences = {}
+    for board_address in service.get_board_addresses():
+        setting_name = board_address + '_state'
+        board : IdSmuBoardModel = service.get_board(board_address)
+        if not board.is_board_initialized():
+            raise RuntimeError(f'The board {board_address} is not initialized')
+        row_count = sum(group.shape[0] for group in setting_service.get_parameter_setting(setting_name).table_groups)
+        applied = setting_service.apply_parameter_setting(setting_name, board_address, False, None)
+        if applied < row_count:
+            raise RuntimeError(f'The table {setting_name} was applied to {applied} of {row_count} resources')
+        differences[board_address] = verify_board_state(setting_service, setting_name, board_address)
+    return differences
+
+
+# The state is saved, a voltage is changed and the saved state is applied again:
+
+# In[ ]:
+
+
+state_path = os.path.join(os.path.abspath(""), "board_state.csv")
+save_board_state(srunner, state_path)
+mbX1.idSmu2Modules['M1.S1'].smu.channels['M1.S1.C1'].voltage = 3
+print(reapply_board_state(srunner, state_path))
+print(mbX1.idSmu2Modules['M1.S1'].smu.channels['M1.S1.C1'].voltage)
+
+
 # In[10]:
 
 
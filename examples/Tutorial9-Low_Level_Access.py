@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Getting startet with the Aspect Device Engine Python API 9
+# ## Low level access
+
+# This is the 9th introductory overview of programming the Aspect Device Engine Python API.  
+# This document is available as pdf and interactive jupyter notebook.
+# The introduction includes the following objectives:
+# - Reading blocks of EEPROM data and caching them
+# - Reading and writing many FPGA registers of many devices
+# - Monitoring status registers in the background
+#   
+# ### Introduction
+# Besides the channel parameters, the board model offers direct access to the EEPROM, the FPGA registers and the status registers of the devices.
+# These methods are mainly used for diagnostics and for special functions of the firmware.
+# *(Note: writing to the EEPROM or to FPGA registers can change the calibration and the behaviour of a device. Only write to addresses whose meaning is known)*
+
+# In[ ]:
+
+
+from aspectdeviceengine.enginecore import IdSmuService, IdSmuServiceRunner, IdSmuBoardModel
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import time
+srunner = IdSmuServiceRunner()
+mbX1 : IdSmuBoardModel = srunner.get_idsmu_service().get_first_board()
+
+
+# ### EEPROM
+# `read_eeprom()` reads a single word from the EEPROM of a device. Data like the calibration values are spread over many addresses,
+# so that reading them requires many calls.
+# The devices of a board can be read in parallel. The helper function `for_each_device()` calls a function for each device in a thread pool
+# and returns the results as dictionary. It is also used in the following sections.
+# `read_eeprom_block()` reads a range of addresses of each device and returns a numpy array per device.
+# The API has no block read for the EEPROM, so each word is still read with its own call of `read_eeprom()`. Only the devices are read in parallel:
+
+# In[ ]:
+
+
+device_executor = ThreadPoolExecutor(max_workers=16)
+
+def for_each_device(function, device_ids):
+    """Calls function(device_id) for all devices in parallel and returns a dictionary device id -> result"""
+    futures = {device_id: device_executor.submit(function, device_id) for device_id in device_ids}
+    return {device_id: future.result() for device_id, future in futures.items()}
+
+def read_eeprom_block(board : IdSmuBoardModel, start, count, device_ids=None):
+    """Reads count words from the EEPROM of each device, starting at the address start, with one read_eeprom() call per word"""
+    if device_ids is None:
+        device_ids = board.get_all_device_hardware_ids()
+    def read(device_id):
+        return np.array([board.read_eeprom(address, device_id) for address in range(start, start + count)], dtype=np.int64)
+    return for_each_device(read, device_ids)
+
+eeprom_words = read_eeprom_block(mbX1, 0, 16)
+for device_id, words in eeprom_words.items():
+    print(device_id, words)
+
+
+# #### Caching EEPROM data
+# The content of the EEPROM only changes when it is written. Data that is needed again and again, e.g. calibration values for the evaluation of measurements,
+# therefore only needs to be read once.
+# The `EepromCache` class below keeps the words that have been read for each device. Only the addresses that are not yet in the cache are read from the device.
+# EEPROM writes must be made with `write()` of the cache, which removes the written address from the cache, so that it is read again with the next access:
+
+# In[ ]:
+
+
+class EepromCache:
+    """Keeps the EEPROM words of the devices of a board that have been read"""
+    def __init__(self, board : IdSmuBoardModel):
+        self.board = board
+        self.words = {}
+
+    def read_block(self, start, count, device_ids=None):
+        """Returns a dictionary device id -> array of count words, starting at the address start"""
+        if device_ids is None:
+            device_ids = self.board.get_all_device_hardware_ids()
+        addresses = range(start, start + count)
+        def read(device_id):
+            words = self.words.setdefault(device_id, {})
+            for address in addresses:
+                if address not in words:
+                    words[address] = self.board.read_eeprom(address, device_id)
+            return np.array([words[address] for address in addresses], dtype=np.int64)
+        return for_each_device(read, device_ids)
+
+    def write(self, address, value, device_id):
+        reply = self.board.write_eeprom(address, value, device_id)
+        self.words.get(device_id, {}).pop(address, None)
+        return reply
+
+    def clear(self):
+        self.words.clear()
+
+eeprom = EepromCache(mbX1)
+start_time = time.perf_counter()
+eeprom.read_block(0, 64)
+print(f'First read: {(time.perf_counter() - start_time) * 1000:.1f} ms')
+start_time = time.perf_counter()
+eeprom.read_block(0, 64)
+print(f'Second read: {(time.perf_counter() - start_time) * 1000:.1f} ms')
+
+
+# ### FPGA registers
+# `read_fpga()`, `write_fpga()` and `write_fpga_with_mask()` access a single register of a single device.
+# To access many registers of many devices, the two functions below take the device ids, addresses, values and masks as lists or arrays of the same length.
+# The accesses are grouped by device, the devices are accessed in parallel and the results are returned as numpy array in the order of the given accesses.
+# As for the EEPROM, the API has no call for many registers: each register is still accessed with its own call, only the devices run in parallel.
+# A mask of -1 (or no masks at all) writes the whole register:
+
+# In[ ]:
+
+
+def group_by_device(device_ids):
+    """Returns a dictionary device id -> indexes of the accesses of the device"""
+    device_ids = np.asarray(device_ids)
+    return {device_id: np.flatnonzero(device_ids == device_id) for device_id in dict.fromkeys(device_ids.tolist())}
+
+def read_fpga_many(board : IdSmuBoardModel, device_ids, addresses):
+    """Reads the registers with one read_fpga() call per register and returns the register values"""
+    addresses = np.asarray(addresses)
+    values = np.zeros(len(addresses), dtype=np.int64)
+    accesses = group_by_device(device_ids)
+    def read(device_id):
+        for index in accesses[device_id]:
+            values[index] = board.read_fpga(int(addresses[index]), device_id)
+    for_each_device(read, accesses)
+    return values
+
+def write_fpga_many(board : IdSmuBoardModel, device_ids, addresses, values, masks=None):
+    """Writes the values with one write_fpga() call per register and returns the written register values"""
+    addresses, values = np.asarray(addresses), np.asarray(values)
+    masks = np.full(len(addresses), -1) if masks is None else np.asarray(masks)
+    written_values = np.zeros(len(addresses), dtype=np.int64)
+    accesses = group_by_device(device_ids)
+    def write(device_id):
+        for index in accesses[device_id]:
+            if masks[index] == -1:
+                written_values[index] = board.write_fpga(int(addresses[index]), int(values[index]), device_id)
+            else:
+                written_values[index] = board.write_fpga_with_mask(int(addresses[index]), int(values[index]), int(masks[index]), device_id)
+    for_each_device(write, accesses)
+    return written_values
+
+
+# In the example, the registers 0 to 3 of all devices are read:
+
+# In[ ]:
+
+
+device_ids = mbX1.get_all_device_hardware_ids()
+register_device_ids = np.repeat(device_ids, 4)
+register_addresses = np.tile(np.arange(4), len(device_ids))
+register_values = read_fpga_many(mbX1, register_device_ids, register_addresses)
+print(register_values.reshape(len(device_ids), 4))
+
+
+# ### Monitoring status registers
+# Conditions like active clamps or errors are shown in the status registers of the devices.
+# Instead of polling the registers in the test program, a background thread can read them at a fixed interval and report only the changes.
+# The `StatusMonitor` class below reads the given status registers of all devices (in parallel, with `read_status_registers()`) and compares them with the last values.
+# The changes are collected as tuples (time, device id, register address, old value, new value) and delivered in batches:
+# either to a callback function, which is called by the monitor thread, or, without callback, to the queue `events`.
+# The test program can then wait for events with `events.get()` without a busy loop.
+# The monitor is started and stopped with a `with` block or with `start()` and `stop()`.
+# An error in the monitor thread (e.g. while reading the registers or in the callback) ends the monitoring and is raised again by `stop()`.
+# If the body of the `with` block raised an error itself, that error is raised with the error of the monitor thread as its cause:
+
+# In[ ]:
+
+
+import queue, threading
+
+class StatusMonitor:
+    """Background thread that reads status registers and reports the changes in batches"""
+    def __init__(self, board : IdSmuBoardModel, register_addresses, device_ids=None, interval=0.01, batch_interval=0.1, callback=None):
+        self.board = board
+        self.register_addresses = list(register_addresses)
+        self.device_ids = board.get_all_device_hardware_ids() if device_ids is None else list(device_ids)
+        self.interval = interval
+        self.batch_interval = batch_interval
+        self.callback = callback
+        self.events = queue.Queue()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.error = None
+
+    def read(self):
+        return for_each_device(lambda device_id: np.array(self.board.read_status_registers(self.register_addresses, device_id)),
+                               self.device_ids)
+
+    def deliver(self, batch):
+        if self.callback is not None:
+            self.callback(batch)
+        else:
+            for event in batch:
+                self.events.put(event)
+
+    def run(self, values):
+        batch, batch_time = [], time.monotonic()
+        try:
+            while not self.stopped.wait(self.interval):
+                new_values = self.read()
+                now = time.time()
+                for device_id, registers in new_values.items():
+                    for index in np.flatnonzero(registers != values[device_id]):
+                        batch.append((now, device_id, self.register_addresses[index], int(values[device_id][index]), int(registers[index])))
+                values = new_values
+                if batch and time.monotonic() - batch_time >= self.batch_interval:
+                    self.deliver(batch)
+                    batch, batch_time = [], time.monotonic()
+            if batch:
+                self.deliver(batch)
+        except Exception as error:
+            # raised again by stop(), the changes read so far are still put into the queue
+            self.error = error
+            if batch and self.callback is None:
+                self.deliver(batch)
+
+    def start(self):
+        self.stopped.clear()
+        self.error = None
+        # the first values are read before start() returns, so that no change after start() is missed
+        self.thread = threading.Thread(target=self.run, args=(self.read(),), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.stop()
+            return False
+        try:
+            self.stop()
+        except Exception as error:
+            raise exc_value from error
+        return False
+
+
+# In the example, the status registers 0 and 1 are monitored while a channel is switched on and off.
+# The first monitor uses the queue, the second one a callback:
+
+# In[ ]:
+
+
+channel1 = mbX1.idSmu2Modules['M1.S1'].smu.channels['M1.S1.C1']
+with StatusMonitor(mbX1, [0, 1], interval=0.01) as monitor:
+    channel1.enabled = True
+    channel1.voltage = 2
+    time.sleep(0.5)
+    channel1.enabled = False
+    time.sleep(0.5)
+while not monitor.events.empty():
+    print(monitor.events.get())
+
+with StatusMonitor(mbX1, [0, 1], callback=lambda batch: print(f'{len(batch)} changes: {batch}')):
+    channel1.enabled = True
+    time.sleep(0.5)
+    channel1.enabled = False
+
+
+# In[ ]:
+
+
+srunner.shutdown()